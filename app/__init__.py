@@ -1,41 +1,114 @@
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional
+
 from argon2 import PasswordHasher
 from litestar import Litestar, Request, Router
 from litestar.datastructures import State
 from litestar.exceptions import NotAuthorizedException
-from litestar.static_files import StaticFilesConfig
 from litestar.types import Scope
-from sqlalchemy import event
-from sqlalchemy.engine.interfaces import DBAPIConnection
-from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
-from sqlalchemy.pool import ConnectionPoolEntry
+from sqlalchemy.ext.asyncio import AsyncEngine
 
 from app.api.auth.controller import AuthController
+from app.api.auth.hasher import AsyncPasswordHasher
 from app.api.auth.models import AuthUser
 from app.api.auth.repo import AuthRepo
+from app.api.auth.signed_token import RevocationList, TokenSigner
+from app.api.auth.throttle import LoginThrottle, RateLimit, create_token_bucket_store
+from app.api.auth.token_cache import TokenCache
+from app.api.auth.token_sweeper import TokenSweeper
+from app.api.metrics.controller import MetricsController
+from app.api.profiles.controller import ProfilesController
+from app.api.static.controller import StaticController
 from app.api.todos.controller import TodoController
+from app.api.todos.response_cache import ResponseCache, create_response_cache
 from app.common import deps
 from app.common.app_state import AppState
+from app.common.background import cancel_tasks, start_periodic_task
+from app.common.db import create_db_engine, optimize
+from app.common.db_writer import DbWriter
 from app.common.get_log import get_logger, log_config
-from app.middleware.auth_middleware import auth_middleware_factory
+from app.common.metrics import Metrics
+from app.common.profiling import RequestProfiler
+from app.common.settings import Settings
+from app.common.static_assets import MANIFEST_FILE, StaticAssets
+from app.middleware.auth_middleware import AUTH_USER_KEY, auth_middleware_factory
+from app.middleware.metrics_middleware import metrics_middleware_factory
+from app.middleware.profiling_middleware import profiling_middleware_factory
 from app.setup_db import setup_db
 
 
-@deps.dep(rename="db")
+@deps.dep(rename="db", lifetime="singleton")
 async def provide_db(state: State) -> AsyncEngine:
     return state["app_state"].db
 
 
-@deps.dep(rename="password_hasher")
-async def provide_password_hasher(state: State) -> PasswordHasher:
+@deps.dep(rename="db_writer", lifetime="singleton")
+async def provide_db_writer(state: State) -> DbWriter:
+    return state["app_state"].db_writer
+
+
+@deps.dep(rename="password_hasher", lifetime="singleton")
+async def provide_password_hasher(state: State) -> AsyncPasswordHasher:
     return state["app_state"].password_hasher
 
 
+@deps.dep(rename="auth_repo", lifetime="singleton")
+async def provide_auth_repo(state: State) -> AuthRepo:
+    return state["app_state"].auth_repo
+
+
+@deps.dep(rename="token_cache", lifetime="singleton")
+async def provide_token_cache(state: State) -> TokenCache:
+    return state["app_state"].token_cache
+
+
+@deps.dep(rename="token_sweeper", lifetime="singleton")
+async def provide_token_sweeper(state: State) -> TokenSweeper:
+    return state["app_state"].token_sweeper
+
+
+@deps.dep(rename="response_cache", lifetime="singleton")
+async def provide_response_cache(state: State) -> ResponseCache:
+    return state["app_state"].response_cache
+
+
+@deps.dep(rename="revocation_list", lifetime="singleton")
+async def provide_revocation_list(state: State) -> RevocationList:
+    return state["app_state"].revocation_list
+
+
+@deps.dep(rename="login_throttle", lifetime="singleton")
+async def provide_login_throttle(state: State) -> LoginThrottle:
+    return state["app_state"].login_throttle
+
+
+@deps.dep(rename="static_assets", lifetime="singleton")
+async def provide_static_assets(state: State) -> StaticAssets:
+    return state["app_state"].static_assets
+
+
+@deps.dep(rename="token_signer", lifetime="singleton")
+async def provide_token_signer(state: State) -> Optional[TokenSigner]:
+    return state["app_state"].token_signer
+
+
+@deps.dep(rename="metrics", lifetime="singleton")
+async def provide_metrics(state: State) -> Optional[Metrics]:
+    return state["app_state"].metrics
+
+
+@deps.dep(rename="profiler", lifetime="singleton")
+async def provide_profiler(state: State) -> Optional[RequestProfiler]:
+    return state["app_state"].profiler
+
+
 @deps.dep(rename="auth_user")
-async def provide_auth_user(state: State) -> AuthUser:
-    app_state: AppState = state["app_state"]
-    if not app_state.auth_user:
+async def provide_auth_user(scope: Scope) -> AuthUser:
+    auth_user: Optional[AuthUser] = scope["state"].get(AUTH_USER_KEY)
+    if not auth_user:
         raise NotAuthorizedException("Invalid token")
-    return app_state.auth_user
+    return auth_user
 
 
 _log = get_logger()
@@ -48,23 +121,100 @@ async def log_exception(exception: Exception, scope: Scope) -> None:
 
 async def startup(app: Litestar) -> None:
     _log.info("Starting app")
-    db_engine = create_async_engine("sqlite+aiosqlite:///data.db")
-
-    @event.listens_for(db_engine.sync_engine, "connect")
-    def _on_connect(dbapi_connection: DBAPIConnection, connection_record: ConnectionPoolEntry) -> None:
-        cur = dbapi_connection.cursor()
-        cur.execute("PRAGMA foreign_keys=ON")
-        cur.close()
-        dbapi_connection.commit()
-
-    await setup_db(db_engine)
+    settings = Settings.from_env()
+    metrics = Metrics() if settings.metrics_enabled else None
+    db_engine = create_db_engine(settings, metrics)
+    if settings.migrate_on_startup:
+        await setup_db(db_engine)
+
+    static_dir = Path(settings.static_build_dir)
+    if not (static_dir / MANIFEST_FILE).exists():
+        _log.info("No static build found, serving the static files uncompressed, run `app build-static` to build them")
+        static_dir = Path(settings.static_source_dir)
+
+    token_cache = TokenCache(settings.token_cache_size, settings.token_cache_ttl_seconds)
+    revocation_list = RevocationList()
+    db_writer = DbWriter(db_engine, settings.db_single_writer, settings.db_writer_max_batch_size)
+    db_writer.start()
+    auth_repo = AuthRepo(db_engine, db_writer, token_cache, revocation_list)
+    app_state = AppState(
+        settings=settings,
+        db=db_engine,
+        db_writer=db_writer,
+        password_hasher=AsyncPasswordHasher.create(
+            PasswordHasher(),
+            settings.password_hasher_executor,
+            settings.password_hasher_workers,
+            settings.password_hasher_max_concurrency,
+        ),
+        auth_repo=auth_repo,
+        token_cache=token_cache,
+        token_sweeper=TokenSweeper(
+            auth_repo, settings.token_sweep_batch_size, timedelta(seconds=settings.token_purge_after_seconds)
+        ),
+        response_cache=create_response_cache(settings.response_cache_backend, settings.response_cache_max_bytes),
+        revocation_list=revocation_list,
+        login_throttle=LoginThrottle(
+            create_token_bucket_store(settings.login_throttle_backend, settings.login_throttle_max_keys),
+            RateLimit(settings.login_throttle_ip_burst, settings.login_throttle_ip_per_minute),
+            RateLimit(settings.login_throttle_email_burst, settings.login_throttle_email_per_minute),
+        ),
+        static_assets=StaticAssets.load(static_dir),
+        token_signer=TokenSigner(settings.token_secret) if settings.token_mode == "signed" else None,
+        metrics=metrics,
+        profiler=(
+            RequestProfiler(
+                Path(settings.profiling_dir),
+                settings.profiling_max_files,
+                settings.profiling_sample_rate,
+                settings.profiling_token,
+            )
+            if settings.profiling_enabled
+            else None
+        ),
+    )
+
+    if settings.db_optimize_interval_seconds > 0:
+        app_state.background_tasks.append(
+            start_periodic_task(settings.db_optimize_interval_seconds, lambda: optimize(db_engine), "db-optimize")
+        )
+
+    if settings.token_sweep_interval_seconds > 0:
+        app_state.background_tasks.append(
+            start_periodic_task(settings.token_sweep_interval_seconds, app_state.token_sweeper.sweep, "token-sweep")
+        )
+
+    if settings.login_throttle_evict_interval_seconds > 0:
+        app_state.background_tasks.append(
+            start_periodic_task(
+                settings.login_throttle_evict_interval_seconds,
+                app_state.login_throttle.store.evict_full,
+                "login-throttle-evict",
+            )
+        )
+
+    if app_state.token_signer:
+
+        async def refresh_revocation_list() -> None:
+            revocation_list.replace(await auth_repo.find_revoked_tokens())
+
+        await refresh_revocation_list()
+        app_state.background_tasks.append(
+            start_periodic_task(
+                settings.token_revocation_refresh_seconds, refresh_revocation_list, "refresh-revocation-list"
+            )
+        )
 
-    app_state = AppState(db=db_engine, password_hasher=PasswordHasher(), auth_repo=AuthRepo(db_engine), auth_user=None)
     app.state.app_state = app_state
+    await deps.dep.build_singletons(app.state)
 
 
 async def shutdown(app: Litestar) -> None:
     app_state: AppState = app.state.app_state
+    await cancel_tasks(app_state.background_tasks)
+    await app_state.db_writer.stop()
+    app_state.password_hasher.shutdown()
+    await optimize(app_state.db)
     await app_state.db.dispose()
 
 
@@ -72,11 +222,11 @@ protected_routes = Router("/", route_handlers=[TodoController], middleware=[auth
 api_router = Router("/api", route_handlers=[AuthController, protected_routes])
 
 app = Litestar(
-    route_handlers=[api_router],
-    static_files_config=[StaticFilesConfig(path="/", directories=["app/static"], html_mode=True)],
+    route_handlers=[api_router, MetricsController, ProfilesController, StaticController],
     on_startup=[startup],
     on_shutdown=[shutdown],
     plugins=[deps.dep],
     logging_config=log_config,
     after_exception=[log_exception],
+    middleware=[metrics_middleware_factory, profiling_middleware_factory],
 )
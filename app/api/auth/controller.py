@@ -1,18 +1,39 @@
-from litestar import Controller, Response, post
-from litestar.status_codes import HTTP_201_CREATED
+from typing import Optional
+
+from litestar import Controller, Request, Response, post
+from litestar.exceptions import NotAuthorizedException, TooManyRequestsException
+from litestar.params import Parameter
+from litestar.status_codes import HTTP_201_CREATED, HTTP_204_NO_CONTENT
 
 from app.api.auth.models import LoginUserRequest, LoginUserResponse, RegisterUserRequest
 from app.api.auth.service import AuthService
+from app.api.auth.throttle import LoginThrottle
+
+
+def _client_ip(request: Request) -> Optional[str]:
+    # Behind a proxy this is only the client's address when the server trusts its forwarded headers
+    return request.client.host if request.client else None
 
 
 class AuthController(Controller):
     path = "/auth"
 
-    @post("/register")
-    async def register(self, data: RegisterUserRequest, auth_service: AuthService) -> Response:
+    @post("/register", raises=[TooManyRequestsException])
+    async def register(
+        self, request: Request, data: RegisterUserRequest, auth_service: AuthService, login_throttle: LoginThrottle
+    ) -> Response:
+        await login_throttle.check(_client_ip(request), data.email)
         await auth_service.register_user(data)
         return Response(None, status_code=HTTP_201_CREATED)
 
-    @post("/login")
-    async def login(self, data: LoginUserRequest, auth_service: AuthService) -> LoginUserResponse:
+    @post("/login", raises=[TooManyRequestsException])
+    async def login(
+        self, request: Request, data: LoginUserRequest, auth_service: AuthService, login_throttle: LoginThrottle
+    ) -> LoginUserResponse:
+        await login_throttle.check(_client_ip(request), data.email)
         return await auth_service.login_user(data)
+
+    @post("/logout", status_code=HTTP_204_NO_CONTENT, raises=[NotAuthorizedException])
+    async def logout(self, auth_service: AuthService, token: str = Parameter(header="Authorization")) -> None:
+        """Revoke the access token sent in the Authorization header"""
+        await auth_service.logout_user(token)
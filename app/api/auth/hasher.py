@@ -0,0 +1,82 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Literal, TypeVar
+
+import msgspec
+from argon2 import PasswordHasher
+
+T = TypeVar("T")
+
+
+class HasherStats(msgspec.Struct):
+    in_flight: int
+    queue_depth: int
+    max_concurrency: int
+
+
+# Module level so they can be pickled when running on a process pool
+def _hash(password_hasher: PasswordHasher, password: str) -> str:
+    return password_hasher.hash(password)
+
+
+def _verify(password_hasher: PasswordHasher, hashed_password: str, password: str) -> bool:
+    return password_hasher.verify(hashed_password, password)
+
+
+class AsyncPasswordHasher:
+    """Runs argon2 hashing and verification on a worker pool so it doesn't block the event loop
+
+    At most ``max_concurrency`` calls are handed to the pool at once, the rest wait their turn and are
+    counted in ``queue_depth``.
+    """
+
+    def __init__(self, password_hasher: PasswordHasher, executor: Executor, max_concurrency: int) -> None:
+        self.password_hasher = password_hasher
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.queue_depth = 0
+
+    @classmethod
+    def create(
+        cls, password_hasher: PasswordHasher, kind: Literal["thread", "process"], workers: int, max_concurrency: int
+    ) -> "AsyncPasswordHasher":
+        workers = workers or os.cpu_count() or 1
+        executor: Executor = (
+            ProcessPoolExecutor(max_workers=workers)
+            if kind == "process"
+            else ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+        )
+        return cls(password_hasher, executor, max_concurrency or workers)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, self.password_hasher, password)
+
+    async def verify(self, hashed_password: str, password: str) -> bool:
+        """Raises the same exceptions as ``PasswordHasher.verify`` when the password doesn't match"""
+        return await self._run(_verify, self.password_hasher, hashed_password, password)
+
+    def check_needs_rehash(self, hashed_password: str) -> bool:
+        # Only parses the hash parameters, cheap enough to run inline
+        return self.password_hasher.check_needs_rehash(hashed_password)
+
+    def stats(self) -> HasherStats:
+        return HasherStats(self.in_flight, self.queue_depth, self.max_concurrency)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn: Callable[..., T], *args: Any) -> T:
+        self.queue_depth += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
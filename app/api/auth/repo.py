@@ -2,115 +2,224 @@ from datetime import UTC, datetime
 from typing import Optional
 
 import msgspec
-from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
 
 from app.api.auth.exceptions import UserAlreadyExistsException
 from app.api.auth.models import AuthUser, InsertToken, InsertUser, Token, UpdateUser, User
-from app.common import deps
+from app.api.auth.signed_token import RevocationList
+from app.api.auth.token_cache import TokenCache
+from app.common.db_writer import DbWriter
 from app.common.get_log import get_logger
-from app.common.utils import camelize_row_mapping
+from app.common.statements import statements
+from app.common.utils import decode_first, decode_one
 
 _logger = get_logger()
 
+FIND_USER_BY_EMAIL_SQL = statements.add(
+    "find_user_by_email",
+    """
+    SELECT *
+    FROM users
+    WHERE email = :email
+    """,
+    explain_params={"email": "user@example.com"},
+)
 
-@deps.dep
+INSERT_USER_SQL = statements.add(
+    "insert_user",
+    """
+    INSERT INTO users (email, hashed_password, created_at)
+    VALUES (:email, :hashed_password, :created_at)
+    RETURNING *
+    """,
+)
+
+UPDATE_USER_SQL = statements.add(
+    "update_user",
+    """
+    UPDATE users
+    SET email = :email,
+    hashed_password = :hashed_password
+    WHERE user_id = :user_id
+    RETURNING *
+    """,
+    explain_params={"email": "user@example.com", "hashed_password": "", "user_id": 1},
+)
+
+INSERT_TOKEN_SQL = statements.add(
+    "insert_token",
+    """
+    INSERT INTO tokens (value, user_id, expires_at, created_at)
+    VALUES (:value, :user_id, :expires_at, :created_at)
+    RETURNING *
+    """,
+)
+
+DEACTIVATE_TOKEN_SQL = statements.add(
+    "deactivate_token",
+    """
+    UPDATE tokens
+    SET active = 0,
+    deactivated_at = CURRENT_TIMESTAMP
+    WHERE token_id = :token_id
+    RETURNING *
+    """,
+    explain_params={"token_id": 1},
+)
+
+# Both sweeps work through the partial indexes on expires_at, a batch at a time to keep write transactions short
+DEACTIVATE_EXPIRED_TOKENS_SQL = statements.add(
+    "deactivate_expired_tokens",
+    """
+    UPDATE tokens
+    SET active = 0,
+    deactivated_at = CURRENT_TIMESTAMP
+    WHERE token_id IN (
+        SELECT token_id
+        FROM tokens
+        WHERE active = 1
+        AND expires_at <= :now
+        LIMIT :batch_size
+    )
+    """,
+    explain_params={"now": datetime.now(tz=UTC), "batch_size": 1000},
+)
+
+PURGE_INACTIVE_TOKENS_SQL = statements.add(
+    "purge_inactive_tokens",
+    """
+    DELETE FROM tokens
+    WHERE token_id IN (
+        SELECT token_id
+        FROM tokens
+        WHERE active = 0
+        AND expires_at <= :cutoff
+        LIMIT :batch_size
+    )
+    """,
+    explain_params={"cutoff": datetime.now(tz=UTC), "batch_size": 1000},
+)
+
+FIND_REVOKED_TOKENS_SQL = statements.add(
+    "find_revoked_tokens",
+    """
+    SELECT value, expires_at
+    FROM tokens
+    WHERE active = 0
+    AND expires_at > :now
+    """,
+    explain_params={"now": datetime.now(tz=UTC)},
+)
+
+FIND_TOKEN_BY_VALUE_SQL = statements.add(
+    "find_token_by_value",
+    """
+    SELECT *
+    FROM tokens
+    WHERE active = 1
+    AND value = :value
+    """,
+    explain_params={"value": "token"},
+)
+
+GET_AUTH_USER_FROM_TOKEN_SQL = statements.add(
+    "get_auth_user_from_token",
+    """
+    SELECT user_id, email, created_at
+    FROM users
+    WHERE user_id = :user_id
+    """,
+    explain_params={"user_id": 1},
+)
+
+
+# Built once in startup, so the auth middleware can use it too, and provided from app state
 class AuthRepo:
-    def __init__(self, db: AsyncEngine) -> None:
+    def __init__(
+        self, db: AsyncEngine, db_writer: DbWriter, token_cache: TokenCache, revocation_list: RevocationList
+    ) -> None:
         self.db = db
+        self.db_writer = db_writer
+        self.token_cache = token_cache
+        self.revocation_list = revocation_list
 
     async def find_user_by_email(self, email: str) -> Optional[User]:
-        sql = """
-        SELECT *
-        FROM users
-        WHERE email = :email
-        """
         async with self.db.connect() as conn:
-            row = (await conn.execute(text(sql), {"email": email})).mappings().fetchone()
-            return msgspec.convert(camelize_row_mapping(row), User) if row else None
+            return decode_first(await conn.execute(FIND_USER_BY_EMAIL_SQL, {"email": email}), User)
 
     async def insert_user(self, insert_user: InsertUser) -> User:
-        sql = """
-        INSERT INTO users (email, hashed_password, created_at)
-        VALUES (:email, :hashed_password, :created_at)
-        RETURNING *
-        """
-        async with self.db.connect() as conn:
-            async with conn.begin():
-                try:
-                    rows = await conn.execute(
-                        text(sql), msgspec.structs.asdict(insert_user) | {"created_at": datetime.now(tz=UTC)}
-                    )
-                    created_user = rows.mappings().one()
-                    return msgspec.convert(camelize_row_mapping(created_user), User)
-                except IntegrityError as ex:
-                    _logger.exception(str(ex))
-                    raise UserAlreadyExistsException("User with the provided email already exists")
+        params = msgspec.structs.asdict(insert_user) | {"created_at": datetime.now(tz=UTC)}
+
+        async def write(conn: AsyncConnection) -> User:
+            return decode_one(await conn.execute(INSERT_USER_SQL, params), User)
+
+        try:
+            return await self.db_writer.submit(write)
+        except IntegrityError as ex:
+            _logger.exception(str(ex))
+            raise UserAlreadyExistsException("User with the provided email already exists")
 
     async def update_user(self, user_id: int, update_user: UpdateUser) -> User:
-        sql = """
-        UPDATE users
-        SET email = :email,
-        hashed_password = :hashed_password
-        WHERE user_id = :user_id
-        RETURNING *
-        """
-        async with self.db.connect() as conn:
-            async with conn.begin():
-                rows = await conn.execute(
-                    text(sql),
-                    {"email": update_user.email, "hashed_password": update_user.hashed_password, "user_id": user_id},
-                )
-                return msgspec.convert(camelize_row_mapping(rows.mappings().one()), User)
+        params = {"email": update_user.email, "hashed_password": update_user.hashed_password, "user_id": user_id}
+
+        async def write(conn: AsyncConnection) -> User:
+            return decode_one(await conn.execute(UPDATE_USER_SQL, params), User)
+
+        return await self.db_writer.submit(write)
 
     async def insert_token(self, insert_token: InsertToken) -> Token:
-        sql = """
-        INSERT INTO tokens (value, user_id, expires_at, created_at)
-        VALUES (:value, :user_id, :expires_at, :created_at)
-        RETURNING *
-        """
-        async with self.db.connect() as conn:
-            async with conn.begin():
-                rows = await conn.execute(
-                    text(sql), msgspec.structs.asdict(insert_token) | {"created_at": datetime.now(tz=UTC)}
-                )
-                return msgspec.convert(camelize_row_mapping(rows.mappings().one()), Token, strict=False)
+        params = msgspec.structs.asdict(insert_token) | {"created_at": datetime.now(tz=UTC)}
+
+        async def write(conn: AsyncConnection) -> Token:
+            return decode_one(await conn.execute(INSERT_TOKEN_SQL, params), Token)
+
+        return await self.db_writer.submit(write)
 
     async def deactivate_token(self, token_id: int) -> Token:
-        sql = """
-        UPDATE tokens
-        SET active = 0,
-        deactivated_at = CURRENT_TIMESTAMP
-        WHERE token_id = :token_id
-        RETURNING *
+        """Deactivate a token and stop trusting it in this process
+
+        Other worker processes notice once their token cache entry's TTL runs out, or for signed tokens on their next
+        revocation list refresh.
         """
+
+        async def write(conn: AsyncConnection) -> Token:
+            return decode_one(await conn.execute(DEACTIVATE_TOKEN_SQL, {"token_id": token_id}), Token)
+
+        deactivated_token = await self.db_writer.submit(write)
+        self.token_cache.invalidate(token_id)
+        self.revocation_list.add(deactivated_token.value, deactivated_token.expires_at)
+        return deactivated_token
+
+    async def deactivate_expired_tokens(self, now: datetime, batch_size: int) -> int:
+        """Deactivate up to ``batch_size`` tokens that expired by ``now``, returns how many were deactivated"""
+        params = {"now": now, "batch_size": batch_size}
+
+        async def write(conn: AsyncConnection) -> int:
+            return (await conn.execute(DEACTIVATE_EXPIRED_TOKENS_SQL, params)).rowcount
+
+        return await self.db_writer.submit(write)
+
+    async def purge_inactive_tokens(self, cutoff: datetime, batch_size: int) -> int:
+        """Delete up to ``batch_size`` inactive tokens that expired by ``cutoff``, returns how many were deleted"""
+        params = {"cutoff": cutoff, "batch_size": batch_size}
+
+        async def write(conn: AsyncConnection) -> int:
+            return (await conn.execute(PURGE_INACTIVE_TOKENS_SQL, params)).rowcount
+
+        return await self.db_writer.submit(write)
+
+    async def find_revoked_tokens(self) -> list[tuple[str, datetime]]:
         async with self.db.connect() as conn:
-            async with conn.begin():
-                rows = await conn.execute(text(sql), {"token_id": token_id})
-                return msgspec.convert(camelize_row_mapping(rows.mappings().one()), Token, strict=False)
+            rows = await conn.execute(FIND_REVOKED_TOKENS_SQL, {"now": datetime.now()})
+            return [(value, datetime.fromisoformat(expires_at)) for value, expires_at in rows.fetchall()]
 
     async def find_token_by_value(self, value: str) -> Optional[Token]:
-        sql = """
-        SELECT *,
-        FROM tokens
-        WHERE active = 1
-        AND value = :value
-        """
         async with self.db.connect() as conn:
-            rows = await conn.execute(text(sql), {"value": value})
-            found_token = rows.mappings().first()
-            if not found_token:
-                return None
-            else:
-                return msgspec.convert(camelize_row_mapping(found_token), Token, strict=False)
+            rows = await conn.execute(FIND_TOKEN_BY_VALUE_SQL, {"value": value})
+            return decode_first(rows, Token)
 
     async def get_auth_user_from_token(self, token: Token) -> AuthUser:
-        sql = """
-        SELECT user_id, email, created_at
-        FROM users
-        WHERE user_id = :user_id
-        """
         async with self.db.connect() as conn:
-            rows = await conn.execute(text(sql), {"user_id": token.user_id})
-            return msgspec.convert(camelize_row_mapping(rows.mappings().one()), AuthUser)
+            rows = await conn.execute(GET_AUTH_USER_FROM_TOKEN_SQL, {"user_id": token.user_id})
+            return decode_one(rows, AuthUser)
@@ -1,11 +1,12 @@
 import random
 import string
 from datetime import datetime, timedelta
+from typing import Optional
 
-from argon2 import PasswordHasher
 from litestar.exceptions import NotAuthorizedException
 
 from app.api.auth.exceptions import UserAlreadyExistsException
+from app.api.auth.hasher import AsyncPasswordHasher
 from app.api.auth.models import (
     InsertToken,
     InsertUser,
@@ -16,23 +17,28 @@ from app.api.auth.models import (
     User,
 )
 from app.api.auth.repo import AuthRepo
+from app.api.auth.signed_token import TokenClaims, TokenSigner
 from app.common import deps
 from app.common.get_log import get_logger
 
 _logger = get_logger()
 
 
-@deps.dep
+@deps.dep(lifetime="singleton")
 class AuthService:
-    def __init__(self, auth_repo: AuthRepo, password_hasher: PasswordHasher) -> None:
+    def __init__(
+        self, auth_repo: AuthRepo, password_hasher: AsyncPasswordHasher, token_signer: Optional[TokenSigner]
+    ) -> None:
         self.auth_repo = auth_repo
         self.password_hasher = password_hasher
+        # Only set when signed tokens are enabled
+        self.token_signer = token_signer
 
     async def register_user(self, register_user_request: RegisterUserRequest) -> User:
         if await self.auth_repo.find_user_by_email(register_user_request.email):
             raise UserAlreadyExistsException("User with specified email already exists")
 
-        hashed_password = self.password_hasher.hash(register_user_request.password)
+        hashed_password = await self.password_hasher.hash(register_user_request.password)
         return await self.auth_repo.insert_user(InsertUser(register_user_request.email, hashed_password))
 
     async def login_user(self, login_user_request: LoginUserRequest) -> LoginUserResponse:
@@ -40,20 +46,34 @@ class AuthService:
         if not stored_user:
             raise NotAuthorizedException("Incorrect email or password")
         try:
-            self.password_hasher.verify(stored_user.hashed_password, login_user_request.password)
+            await self.password_hasher.verify(stored_user.hashed_password, login_user_request.password)
         except Exception:
             raise NotAuthorizedException("Incorrect email or password")
         if self.password_hasher.check_needs_rehash(stored_user.hashed_password):
             _logger.info("User password needs rehashing")
-            new_hashed_password = self.password_hasher.hash(login_user_request.password)
+            new_hashed_password = await self.password_hasher.hash(login_user_request.password)
             await self.auth_repo.update_user(stored_user.user_id, UpdateUser(stored_user.email, new_hashed_password))
 
-        access_token = InsertToken(
-            value="".join(random.choices(string.ascii_letters + string.digits, k=32)),
-            user_id=stored_user.user_id,
-            expires_at=datetime.now() + timedelta(minutes=5),
-        )
+        expires_at = datetime.now() + timedelta(minutes=5)
+        nonce = "".join(random.choices(string.ascii_letters + string.digits, k=32))
+        if self.token_signer:
+            # Signed tokens are still recorded so they can be deactivated (revoked) later
+            value = self.token_signer.sign(
+                TokenClaims(
+                    stored_user.user_id, stored_user.email, stored_user.created_at, expires_at.timestamp(), nonce
+                )
+            )
+        else:
+            value = nonce
+        access_token = InsertToken(value=value, user_id=stored_user.user_id, expires_at=expires_at)
 
         await self.auth_repo.insert_token(access_token)
 
         return LoginUserResponse(access_token=access_token.value)
+
+    async def logout_user(self, token_value: str) -> None:
+        """Deactivate the token, it's rejected from then on"""
+        token = await self.auth_repo.find_token_by_value(token_value)
+        if not token:
+            raise NotAuthorizedException("Invalid token")
+        await self.auth_repo.deactivate_token(token.token_id)
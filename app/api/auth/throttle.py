@@ -0,0 +1,134 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Literal, Optional
+
+import msgspec
+from litestar.exceptions import TooManyRequestsException
+
+
+class RateLimit(msgspec.Struct, frozen=True):
+    # Attempts allowed in a burst, then refilled at per_minute, which must be above 0
+    burst: int
+    per_minute: float
+
+
+class TokenBucketStoreStats(msgspec.Struct):
+    allowed: int
+    throttled: int
+    evictions: int
+    keys: int
+    max_keys: int
+
+
+class _Bucket(msgspec.Struct, gc=False):
+    tokens: float
+    updated_at: float
+    # When the bucket will have refilled, from then on it's the same as a missing one and can be dropped
+    full_at: float
+
+
+class TokenBucketStore(ABC):
+    """Token buckets by key, e.g. one per client IP
+
+    Methods are async so a store shared between workers can implement them, otherwise each worker enforces the
+    limits on its own.
+    """
+
+    @abstractmethod
+    async def take(self, key: str, limit: RateLimit) -> float:
+        """Take a token from ``key``'s bucket, returns 0 if there was one, otherwise seconds until there will be"""
+        ...
+
+    @abstractmethod
+    async def evict_full(self) -> int:
+        """Drop buckets that have refilled, returns how many were dropped"""
+        ...
+
+    @abstractmethod
+    async def stats(self) -> TokenBucketStoreStats:
+        ...
+
+
+class InMemoryTokenBucketStore(TokenBucketStore):
+    """Buckets in this process, dropping the least recently used ones past ``max_keys``"""
+
+    def __init__(self, max_keys: int) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, _Bucket] = OrderedDict()
+        self.allowed = 0
+        self.throttled = 0
+        self.evictions = 0
+
+    async def take(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        per_second = limit.per_minute / 60
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(limit.burst, now, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            bucket.tokens = min(limit.burst, bucket.tokens + (now - bucket.updated_at) * per_second)
+            bucket.updated_at = now
+            self._buckets.move_to_end(key)
+
+        if bucket.tokens < 1:
+            self.throttled += 1
+            return (1 - bucket.tokens) / per_second
+        bucket.tokens -= 1
+        bucket.full_at = now + (limit.burst - bucket.tokens) / per_second
+        self.allowed += 1
+        return 0
+
+    async def evict_full(self) -> int:
+        now = time.monotonic()
+        full = [key for key, bucket in self._buckets.items() if bucket.full_at <= now]
+        for key in full:
+            del self._buckets[key]
+        return len(full)
+
+    async def stats(self) -> TokenBucketStoreStats:
+        return TokenBucketStoreStats(self.allowed, self.throttled, self.evictions, len(self._buckets), self.max_keys)
+
+
+class NoTokenBucketStore(TokenBucketStore):
+    """Allows everything, for turning throttling off"""
+
+    async def take(self, key: str, limit: RateLimit) -> float:
+        return 0
+
+    async def evict_full(self) -> int:
+        return 0
+
+    async def stats(self) -> TokenBucketStoreStats:
+        return TokenBucketStoreStats(0, 0, 0, 0, 0)
+
+
+def create_token_bucket_store(backend: Literal["memory", "none"], max_keys: int) -> TokenBucketStore:
+    if backend == "none":
+        return NoTokenBucketStore()
+    return InMemoryTokenBucketStore(max_keys)
+
+
+class LoginThrottle:
+    """Limits login and register attempts per client IP and per email, before any password hashing happens"""
+
+    def __init__(self, store: TokenBucketStore, ip_limit: RateLimit, email_limit: RateLimit) -> None:
+        self.store = store
+        self.ip_limit = ip_limit
+        self.email_limit = email_limit
+
+    async def check(self, ip: Optional[str], email: str) -> None:
+        # The IP goes first, so a client that's already throttled can't also use up the attempts of the emails it
+        # tries
+        retry_after = await self.store.take(f"ip:{ip}", self.ip_limit)
+        if not retry_after:
+            retry_after = await self.store.take(f"email:{email.lower()}", self.email_limit)
+        if retry_after:
+            raise TooManyRequestsException(
+                "Too many attempts, try again later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+import msgspec
+
+from app.api.auth.models import AuthUser
+
+
+class TokenCacheStats(msgspec.Struct):
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    max_size: int
+
+
+class _CacheEntry(msgspec.Struct):
+    token_id: int
+    auth_user: AuthUser
+    expires_at: datetime
+    cached_until: float
+
+
+class TokenCache:
+    """Bounded LRU cache of token value -> resolved AuthUser
+
+    Entries are dropped when the token expires, when they outlive the TTL, when the cache is full
+    (least recently used first), or explicitly when the token is deactivated.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._values_by_token_id: dict[int, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, value: str) -> Optional[AuthUser]:
+        entry = self._entries.get(value)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.monotonic() > entry.cached_until or datetime.now() > entry.expires_at:
+            self._remove(value)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(value)
+        self.hits += 1
+        return entry.auth_user
+
+    def put(self, value: str, token_id: int, auth_user: AuthUser, expires_at: datetime) -> None:
+        if self.max_size <= 0:
+            return
+        if value in self._entries:
+            self._remove(value)
+        self._entries[value] = _CacheEntry(token_id, auth_user, expires_at, time.monotonic() + self.ttl_seconds)
+        self._values_by_token_id[token_id] = value
+        while len(self._entries) > self.max_size:
+            _, oldest = self._entries.popitem(last=False)
+            self._values_by_token_id.pop(oldest.token_id, None)
+            self.evictions += 1
+
+    def invalidate(self, token_id: int) -> None:
+        value = self._values_by_token_id.get(token_id)
+        if value is not None:
+            self._remove(value)
+
+    def stats(self) -> TokenCacheStats:
+        return TokenCacheStats(self.hits, self.misses, self.evictions, len(self._entries), self.max_size)
+
+    def _remove(self, value: str) -> None:
+        entry = self._entries.pop(value, None)
+        if entry is not None:
+            self._values_by_token_id.pop(entry.token_id, None)
@@ -0,0 +1,46 @@
+from typing import Optional
+
+from litestar import Controller, get
+from litestar.exceptions import NotFoundException
+
+from app.api.auth.hasher import AsyncPasswordHasher
+from app.api.auth.throttle import LoginThrottle
+from app.api.auth.token_cache import TokenCache
+from app.api.auth.token_sweeper import TokenSweeper
+from app.api.todos.response_cache import ResponseCache
+from app.common.db_writer import DbWriter
+from app.common.get_log import get_log_queue_stats
+from app.common.metrics import Metrics, render_stats
+
+# Litestar appends the charset
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4"
+
+
+class MetricsController(Controller):
+    path = "/metrics"
+
+    @get("/", media_type=PROMETHEUS_MEDIA_TYPE, include_in_schema=False)
+    async def get_metrics(
+        self,
+        metrics: Optional[Metrics],
+        response_cache: ResponseCache,
+        token_cache: TokenCache,
+        token_sweeper: TokenSweeper,
+        login_throttle: LoginThrottle,
+        password_hasher: AsyncPasswordHasher,
+        db_writer: DbWriter,
+    ) -> str:
+        if not metrics:
+            raise NotFoundException("Metrics are turned off, set APP_METRICS_ENABLED=true")
+        lines = [
+            *render_stats("response_cache", await response_cache.stats()),
+            *render_stats("token_cache", token_cache.stats()),
+            *render_stats("token_sweeper", token_sweeper.stats()),
+            *render_stats("login_throttle", await login_throttle.store.stats()),
+            *render_stats("password_hasher", password_hasher.stats()),
+            *render_stats("db_writer", db_writer.stats()),
+        ]
+        log_queue_stats = get_log_queue_stats()
+        if log_queue_stats:
+            lines.extend(render_stats("log_queue", log_queue_stats))
+        return metrics.render() + "\n".join(lines) + "\n"
@@ -0,0 +1,44 @@
+from typing import Optional
+
+from litestar import Controller, get
+from litestar.exceptions import NotAuthorizedException, NotFoundException, PermissionDeniedException
+from litestar.params import Parameter
+from litestar.response import File
+
+from app.common.profiling import ProfileInfo, RequestProfiler
+from app.middleware.profiling_middleware import PROFILE_HEADER, PROFILES_PATH
+
+
+def _check_access(profiler: Optional[RequestProfiler], token: Optional[str]) -> RequestProfiler:
+    if not profiler:
+        raise NotFoundException("Profiling is turned off, set APP_PROFILING_ENABLED=true")
+    # Profiles show code paths and timings, without a token to check nobody gets them over HTTP
+    if not profiler.token:
+        raise PermissionDeniedException("Set APP_PROFILING_TOKEN to access profiles")
+    if not profiler.has_token(token):
+        raise NotAuthorizedException(f"Missing or wrong {PROFILE_HEADER} header")
+    return profiler
+
+
+class ProfilesController(Controller):
+    path = PROFILES_PATH
+
+    @get("/", include_in_schema=False)
+    async def list_profiles(
+        self,
+        profiler: Optional[RequestProfiler],
+        token: Optional[str] = Parameter(header=PROFILE_HEADER, default=None),
+    ) -> list[ProfileInfo]:
+        return _check_access(profiler, token).list_profiles()
+
+    @get("/{name:str}", include_in_schema=False)
+    async def get_profile(
+        self,
+        name: str,
+        profiler: Optional[RequestProfiler],
+        token: Optional[str] = Parameter(header=PROFILE_HEADER, default=None),
+    ) -> File:
+        path = _check_access(profiler, token).get_path(name)
+        if not path:
+            raise NotFoundException(f"No profile named {name}")
+        return File(path, filename=name, media_type="application/octet-stream")
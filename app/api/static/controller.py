@@ -0,0 +1,41 @@
+from typing import Optional
+
+from litestar import Controller, HttpMethod, Request, route
+from litestar.exceptions import NotFoundException
+from litestar.params import Parameter
+from litestar.response.base import ASGIResponse
+from litestar.status_codes import HTTP_200_OK, HTTP_304_NOT_MODIFIED
+
+from app.common.static_assets import StaticAssets, pick_encoding
+from app.common.utils import etag_matches
+
+
+class StaticController(Controller):
+    path = "/"
+    include_in_schema = False
+
+    # Returns an ASGIResponse, Response always sends its body, even to HEAD requests
+    @route(["/", "/{file_path:path}"], http_method=[HttpMethod.GET, HttpMethod.HEAD])
+    async def get_static_file(
+        self,
+        request: Request,
+        static_assets: StaticAssets,
+        file_path: str = "/",
+        accept_encoding: Optional[str] = Parameter(header="Accept-Encoding", default=None),
+        if_none_match: Optional[str] = Parameter(header="If-None-Match", default=None),
+    ) -> ASGIResponse:
+        """Serve a static file, choosing between its precompressed variants by Accept-Encoding"""
+        asset = static_assets.get(file_path)
+        if asset is None:
+            raise NotFoundException()
+        encoding = pick_encoding(accept_encoding, set(asset.variants))
+        body, etag = asset.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if etag_matches(if_none_match, etag):
+            return ASGIResponse(status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+        response = ASGIResponse(body=body, headers=headers, media_type=asset.media_type, status_code=HTTP_200_OK)
+        # Built with the body so HEAD gets the same Content-Type and Content-Length, the body itself isn't sent
+        response.is_head_response = request.method == HttpMethod.HEAD
+        return response
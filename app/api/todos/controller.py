@@ -1,22 +1,150 @@
-from typing import Optional
+from typing import AsyncIterator, Literal, Optional
 
-from litestar import Controller, delete, get, post, put
+from litestar import Controller, MediaType, Response, delete, get, post, put
+from litestar.datastructures import ResponseHeader
+from litestar.exceptions import ValidationException
+from litestar.openapi.datastructures import ResponseSpec
+from litestar.params import Parameter
+from litestar.response import Stream
+from litestar.status_codes import HTTP_200_OK, HTTP_304_NOT_MODIFIED
 
 from app.api.auth.models import AuthUser
-from app.api.todos.models import CreateTodoRequest, GetTodosRequest, Todo, UpdateTodoRequest
-from app.api.todos.repo import TodoRepo
+from app.api.todos.models import (
+    BatchTodoResult,
+    BatchUpdateTodoRequest,
+    CreateTodoRequest,
+    GetTodosRequest,
+    Todo,
+    TodoStats,
+    UpdateTodoRequest,
+)
+from app.api.todos.repo import TodoRepo, get_listing_key
+from app.common.encoding import BufferedJsonEncoder
+from app.common.utils import etag_matches
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 1000
+
+# Largest value SQLite binds as an integer, also the bound of search offsets
+MAX_TODO_ID = 2**63 - 1
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NEXT_OFFSET_HEADER = "X-Next-Offset"
+MAX_SEARCH_QUERY_LENGTH = 200
+# Listings are per user, so caches must key them on the token and check back before reusing one
+LISTING_CACHE_HEADERS = {"Vary": "Authorization", "Cache-Control": "private, no-cache"}
+
+_encoder = BufferedJsonEncoder()
+
+
+async def _encode_ndjson(batches: AsyncIterator[list[Todo]]) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield _encoder.encode_lines(batch)
+
+
+async def _encode_json_array(batches: AsyncIterator[list[Todo]]) -> AsyncIterator[bytes]:
+    yield b"["
+    first = True
+    async for batch in batches:
+        if not batch:
+            continue
+        yield _encoder.encode_array_items(batch, first)
+        first = False
+    yield b"]"
+
+
+def _check_batch_size(items: list) -> None:
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValidationException(f"A batch can contain at most {MAX_BATCH_SIZE} items")
 
 
 class TodoController(Controller):
     path = "/todos"
 
-    @get("/")
+    @get(
+        "/",
+        # The body is returned already encoded, so its schema has to be spelled out
+        responses={
+            HTTP_200_OK: ResponseSpec(
+                list[Todo],
+                generate_examples=False,
+                description=(
+                    f"The user's todos, all of them unless `after` or `limit` is passed, otherwise a page of "
+                    f"`limit` (default {DEFAULT_PAGE_SIZE}) todos. `{NEXT_CURSOR_HEADER}` is the `after` for the next "
+                    "page, missing on the last page. Send the `ETag` back in `If-None-Match` to get a 304 if none of "
+                    "the user's todos changed."
+                ),
+            )
+        },
+    )
     async def get_todos(
+        self,
+        todo_repo: TodoRepo,
+        auth_user: AuthUser,
+        complete: Optional[bool] = None,
+        after: Optional[int] = Parameter(default=None, ge=0, le=MAX_TODO_ID),
+        limit: Optional[int] = Parameter(default=None, ge=1, le=MAX_PAGE_SIZE),
+        if_none_match: Optional[str] = Parameter(header="If-None-Match", default=None),
+    ) -> Response[bytes]:
+        # Clients from before pagination pass neither and still get every todo
+        if limit is None and after is not None:
+            limit = DEFAULT_PAGE_SIZE
+        get_todos_request = GetTodosRequest(complete, after, limit)
+        # Read before the todos, so a write landing in between leaves the ETag stale rather than the content. The
+        # filters are part of it, every page and filtered view is a different representation
+        version = await todo_repo.get_version()
+        etag = f'"{auth_user.user_id}-{get_listing_key(version, get_todos_request)}"'
+        headers = {"ETag": etag, **LISTING_CACHE_HEADERS}
+        if etag_matches(if_none_match, etag):
+            return Response(b"", status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+
+        page = await todo_repo.get_encoded_todos(get_todos_request, version)
+        if page.next_cursor is not None:
+            headers[NEXT_CURSOR_HEADER] = str(page.next_cursor)
+        return Response(page.body, headers=headers, media_type=MediaType.JSON)
+
+    @get(
+        "/search",
+        response_headers=[
+            ResponseHeader(
+                name=NEXT_OFFSET_HEADER,
+                documentation_only=True,
+                description="Pass as `offset` to fetch the next page, missing on the last page",
+            )
+        ],
+    )
+    async def search_todos(
+        self,
+        todo_repo: TodoRepo,
+        q: str = Parameter(min_length=1, max_length=MAX_SEARCH_QUERY_LENGTH),
+        limit: int = Parameter(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        offset: int = Parameter(default=0, ge=0, le=MAX_TODO_ID),
+    ) -> Response[list[Todo]]:
+        """Todos whose title or description contain every word in `q`, best matches first"""
+        page = await todo_repo.search_todos(q, limit, offset)
+        headers = {NEXT_OFFSET_HEADER: str(page.next_offset)} if page.next_offset is not None else None
+        return Response(page.todos, headers=headers)
+
+    @get("/stats")
+    async def get_todo_stats(self, todo_repo: TodoRepo) -> TodoStats:
+        """Counts of the user's todos, read from counters kept up to date on every write"""
+        return await todo_repo.get_stats()
+
+    @get("/stream")
+    async def stream_todos(
         self,
         todo_repo: TodoRepo,
         complete: Optional[bool] = None,
-    ) -> list[Todo]:
-        return await todo_repo.get_todos(GetTodosRequest(complete))
+        after: Optional[int] = Parameter(default=None, ge=0, le=MAX_TODO_ID),
+        output_format: Literal["ndjson", "json"] = Parameter(query="format", default="ndjson"),
+    ) -> Stream:
+        """Stream every matching todo, as newline delimited JSON or a chunked JSON array"""
+        batches = todo_repo.stream_todos(GetTodosRequest(complete, after), STREAM_BATCH_SIZE)
+        if output_format == "json":
+            return Stream(_encode_json_array(batches), media_type="application/json")
+        return Stream(_encode_ndjson(batches), media_type="application/x-ndjson")
 
     @post("/")
     async def create_todo(self, data: CreateTodoRequest, todo_repo: TodoRepo, auth_user: AuthUser) -> Todo:
@@ -31,3 +159,21 @@ class TodoController(Controller):
     @delete("/{todo_id:int}")
     async def delete_todo(self, todo_id: int, todo_repo: TodoRepo) -> None:
         await todo_repo.delete_todo(todo_id)
+
+    @post("/batch")
+    async def create_todos(self, data: list[CreateTodoRequest], todo_repo: TodoRepo) -> list[BatchTodoResult]:
+        """Create every todo in a single transaction"""
+        _check_batch_size(data)
+        return await todo_repo.create_todos(data)
+
+    @put("/batch")
+    async def update_todos(self, data: list[BatchUpdateTodoRequest], todo_repo: TodoRepo) -> list[BatchTodoResult]:
+        """Update every todo in a single transaction, todos that don't exist are reported per item"""
+        _check_batch_size(data)
+        return await todo_repo.update_todos(data)
+
+    @delete("/batch", status_code=HTTP_200_OK)
+    async def delete_todos(self, data: list[int], todo_repo: TodoRepo) -> list[BatchTodoResult]:
+        """Delete every todo id in the body in a single transaction, todos that don't exist are reported per item"""
+        _check_batch_size(data)
+        return await todo_repo.delete_todos(data)
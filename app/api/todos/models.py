@@ -12,12 +12,20 @@ class CreateTodoRequest(Base):
 
 class GetTodosRequest(Base):
     complete: Optional[bool]
+    # Keyset pagination - only todos with an id greater than `after` are returned
+    after: Optional[int] = None
+    limit: Optional[int] = None
 
 
 class UpdateTodoRequest(Base):
     complete: bool
 
 
+class BatchUpdateTodoRequest(Base):
+    todo_id: int
+    complete: bool
+
+
 class Todo(Base):
     todo_id: int
     user_id: int
@@ -26,3 +34,30 @@ class Todo(Base):
     due_date: Optional[date]
     complete: bool
     created_at: datetime
+
+
+class TodoPage(Base):
+    todos: list[Todo]
+    # The `after` value to fetch the next page with, None on the last page
+    next_cursor: Optional[int]
+
+
+class TodoSearchPage(Base):
+    # Best matches first
+    todos: list[Todo]
+    # The `offset` to fetch the next page with, None on the last page
+    next_offset: Optional[int]
+
+
+class TodoStats(Base):
+    total: int
+    complete: int
+    # Open todos due before today
+    overdue: int
+
+
+class BatchTodoResult(Base):
+    # Results are returned in the same order as the request's items
+    ok: bool
+    todo: Optional[Todo] = None
+    error: Optional[str] = None
@@ -1,74 +1,505 @@
+import re
+from datetime import date
+from itertools import product
+from typing import Any, AsyncIterator, Optional, TypeVar
+
 import msgspec
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy import TextClause, bindparam
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
 
 from app.api.auth.models import AuthUser
-from app.api.todos.models import CreateTodoRequest, GetTodosRequest, Todo, UpdateTodoRequest
+from app.api.todos.models import (
+    BatchTodoResult,
+    BatchUpdateTodoRequest,
+    CreateTodoRequest,
+    GetTodosRequest,
+    Todo,
+    TodoPage,
+    TodoSearchPage,
+    TodoStats,
+    UpdateTodoRequest,
+)
+from app.api.todos.response_cache import EncodedTodoPage, ResponseCache
 from app.common import deps
-from app.common.utils import camelize_row_mapping
+from app.common.db_writer import DbWriter, WriteOp
+from app.common.statements import statements
+from app.common.utils import decode_all, decode_one, get_row_decoder
+
+GET_TODOS_SQL = """
+SELECT * FROM todos
+WHERE user_id = :user_id
+"""
+
+CREATE_TODO_SQL = statements.add(
+    "create_todo",
+    """
+    INSERT INTO todos (user_id, title, description, due_date)
+    VALUES (:user_id, :title, :description, :due_date)
+    RETURNING *
+    """,
+)
+
+UPDATE_TODO_SQL = statements.add(
+    "update_todo",
+    """
+    UPDATE todos
+    SET complete = :complete
+    WHERE todo_id = :todo_id
+    AND user_id = :user_id
+    RETURNING *
+    """,
+    explain_params={"complete": True, "todo_id": 1, "user_id": 1},
+)
+
+DELETE_TODO_SQL = statements.add(
+    "delete_todo",
+    """
+    DELETE FROM todos
+    WHERE todo_id = :todo_id
+    AND user_id = :user_id
+    RETURNING *
+    """,
+    explain_params={"todo_id": 1, "user_id": 1},
+)
+
+# Batch statements run with executemany, so they can't use RETURNING and the rows are read back separately
+BATCH_CREATE_TODO_SQL = statements.add(
+    "batch_create_todo",
+    """
+    INSERT INTO todos (user_id, title, description, due_date)
+    VALUES (:user_id, :title, :description, :due_date)
+    """,
+)
+
+TODOS_CREATED_AFTER_SQL = statements.add(
+    "todos_created_after",
+    """
+    SELECT * FROM todos
+    WHERE user_id = :user_id
+    AND todo_id > :after
+    ORDER BY todo_id
+    """,
+    explain_params={"user_id": 1, "after": 1},
+)
+
+GET_TODOS_BY_ID_SQL = statements.add(
+    "get_todos_by_id",
+    """
+    SELECT * FROM todos
+    WHERE user_id = :user_id
+    AND todo_id IN :todo_ids
+    """,
+    bindparam("todo_ids", expanding=True),
+    explain_params={"user_id": 1, "todo_ids": [1, 2]},
+)
+
+BATCH_UPDATE_TODO_SQL = statements.add(
+    "batch_update_todo",
+    """
+    UPDATE todos
+    SET complete = :complete
+    WHERE todo_id = :todo_id
+    AND user_id = :user_id
+    """,
+    explain_params={"complete": True, "todo_id": 1, "user_id": 1},
+)
+
+BATCH_DELETE_TODO_SQL = statements.add(
+    "batch_delete_todo",
+    """
+    DELETE FROM todos
+    WHERE todo_id = :todo_id
+    AND user_id = :user_id
+    """,
+    explain_params={"todo_id": 1, "user_id": 1},
+)
+
+# Bumped by triggers on every write to the user's todos, users who never wrote anything have no row
+GET_TODO_VERSION_SQL = statements.add(
+    "get_todo_version",
+    """
+    SELECT version FROM todo_versions
+    WHERE user_id = :user_id
+    """,
+    explain_params={"user_id": 1},
+)
+
+# Overdue todos are open ones due before today, summed over the user's due date counts
+GET_TODO_STATS_SQL = statements.add(
+    "get_todo_stats",
+    """
+    SELECT
+        COALESCE((SELECT total FROM todo_stats WHERE user_id = :user_id), 0) AS total,
+        COALESCE((SELECT complete FROM todo_stats WHERE user_id = :user_id), 0) AS complete,
+        (
+            SELECT COALESCE(SUM(open_count), 0)
+            FROM todo_due_counts
+            WHERE user_id = :user_id
+            AND due_date < :today
+        ) AS overdue
+    """,
+    explain_params={"user_id": 1, "today": date.today()},
+)
+
+# Users whose stored counts differ from counting their todos, in a single statement so it reads one snapshot.
+# A stats row left at zero after deleting every todo isn't drift
+FIND_DRIFTED_TODO_STATS_SQL = statements.add(
+    "find_drifted_todo_stats",
+    """
+    WITH actual AS (
+        SELECT user_id, COUNT(*) AS total, SUM(complete) AS complete
+        FROM todos
+        GROUP BY user_id
+    ),
+    actual_due AS (
+        SELECT user_id, due_date, COUNT(*) AS open_count
+        FROM todos
+        WHERE due_date IS NOT NULL
+        AND complete = 0
+        GROUP BY user_id, due_date
+    )
+    SELECT a.user_id
+    FROM actual a
+    LEFT JOIN todo_stats s ON s.user_id = a.user_id
+    WHERE s.total IS NOT a.total OR s.complete IS NOT a.complete
+    UNION
+    SELECT s.user_id
+    FROM todo_stats s
+    LEFT JOIN actual a ON a.user_id = s.user_id
+    WHERE a.user_id IS NULL AND (s.total != 0 OR s.complete != 0)
+    UNION
+    SELECT a.user_id
+    FROM actual_due a
+    LEFT JOIN todo_due_counts d ON d.user_id = a.user_id AND d.due_date = a.due_date
+    WHERE d.open_count IS NOT a.open_count
+    UNION
+    SELECT d.user_id
+    FROM todo_due_counts d
+    LEFT JOIN actual_due a ON a.user_id = d.user_id AND a.due_date = d.due_date
+    WHERE a.open_count IS NOT d.open_count
+    ORDER BY 1
+    """,
+)
+
+CLEAR_TODO_STATS_SQL = statements.add(
+    "clear_todo_stats",
+    """
+    DELETE FROM todo_stats
+    """,
+)
+
+CLEAR_TODO_DUE_COUNTS_SQL = statements.add(
+    "clear_todo_due_counts",
+    """
+    DELETE FROM todo_due_counts
+    """,
+)
+
+FILL_TODO_STATS_SQL = statements.add(
+    "fill_todo_stats",
+    """
+    INSERT INTO todo_stats (user_id, total, complete)
+    SELECT user_id, COUNT(*), SUM(complete) FROM todos GROUP BY user_id
+    """,
+)
+
+FILL_TODO_DUE_COUNTS_SQL = statements.add(
+    "fill_todo_due_counts",
+    """
+    INSERT INTO todo_due_counts (user_id, due_date, open_count)
+    SELECT user_id, due_date, COUNT(*) FROM todos
+    WHERE due_date IS NOT NULL AND complete = 0
+    GROUP BY user_id, due_date
+    """,
+)
+
+# rank is configured in the migration creating todos_fts, ordering by it lets FTS5 sort without a temp b-tree
+SEARCH_TODOS_SQL = statements.add(
+    "search_todos",
+    """
+    SELECT todos.*
+    FROM todos_fts
+    JOIN todos ON todos.todo_id = todos_fts.rowid
+    WHERE todos_fts MATCH :match
+    AND todos.user_id = :user_id
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+    """,
+    explain_params={
+        "match": 'user_id : "1" AND {title description} : ("todo"*)',
+        "user_id": 1,
+        "limit": 101,
+        "offset": 0,
+    },
+)
+
+CLEAR_SEARCH_INDEX_SQL = statements.add(
+    "clear_search_index",
+    """
+    INSERT INTO todos_fts (todos_fts) VALUES ('delete-all')
+    """,
+)
+
+FILL_SEARCH_INDEX_SQL = statements.add(
+    "fill_search_index",
+    """
+    INSERT INTO todos_fts (rowid, title, description, user_id)
+    SELECT todo_id, title, description, user_id FROM todos
+    """,
+)
+
+OPTIMIZE_SEARCH_INDEX_SQL = statements.add(
+    "optimize_search_index",
+    """
+    INSERT INTO todos_fts (todos_fts) VALUES ('optimize')
+    """,
+)
+
+TODO_NOT_FOUND = "Todo not found"
+
+_SEARCH_TERM = re.compile(r"\w+")
+
+T = TypeVar("T")
+
+_encoder = msgspec.json.Encoder()
+
+
+def _get_todos_sql(complete: bool, after: bool, limit: bool) -> str:
+    sql = GET_TODOS_SQL
+    if complete:
+        sql += " AND complete = :complete"
+    if after:
+        sql += " AND todo_id > :after"
+    sql += " ORDER BY todo_id"
+    if limit:
+        sql += " LIMIT :limit"
+    return sql
+
+
+# One statement per combination of filters (complete, after, limit), so listings never build SQL per request
+GET_TODOS_FILTERS = ("complete", "after", "limit")
+# Filter -> the value `app explain-queries` plans its variants with
+_GET_TODOS_EXPLAIN_PARAMS = {"complete": True, "after": 1, "limit": 101}
+GET_TODOS_VARIANTS: dict[tuple[bool, bool, bool], TextClause] = {
+    variant: statements.add(
+        "_".join(["get_todos", *(name for name, used in zip(GET_TODOS_FILTERS, variant) if used)]),
+        _get_todos_sql(*variant),
+        explain_params={
+            "user_id": 1,
+            **{name: _GET_TODOS_EXPLAIN_PARAMS[name] for name, used in zip(GET_TODOS_FILTERS, variant) if used},
+        },
+    )
+    for variant in product((False, True), repeat=3)
+}
+
+
+def get_listing_key(version: int, get_todos_request: GetTodosRequest) -> str:
+    """One page of a user's listing as of ``version``, keys the response cache and makes up the ETag"""
+    r = get_todos_request
+    return f"{version}-{r.complete}-{r.after}-{r.limit}"
+
+
+def get_todos_query(user_id: int, get_todos_request: GetTodosRequest) -> tuple[TextClause, dict[str, Any]]:
+    params: dict[str, Any] = {"user_id": user_id}
+    if get_todos_request.complete is not None:
+        params["complete"] = get_todos_request.complete
+    if get_todos_request.after is not None:
+        params["after"] = get_todos_request.after
+    if get_todos_request.limit is not None:
+        # Fetch one extra row to find out whether there's another page
+        params["limit"] = get_todos_request.limit + 1
+    variant = ("complete" in params, "after" in params, "limit" in params)
+    return GET_TODOS_VARIANTS[variant], params
+
+
+def get_search_match(user_id: int, query: str) -> Optional[str]:
+    """The FTS5 query for the user's todos matching every word in ``query``, None if it has no words"""
+    terms = _SEARCH_TERM.findall(query)
+    if not terms:
+        return None
+    # Quoted so user input is never parsed as FTS5 syntax, the last word also matches as a prefix
+    phrases = [f'"{term}"' for term in terms]
+    phrases[-1] += "*"
+    return f'user_id : "{user_id}" AND {{title description}} : ({" AND ".join(phrases)})'
+
+
+async def rebuild_search_index(engine: AsyncEngine) -> int:
+    """Re-index every todo from scratch, returns how many were indexed"""
+    async with engine.begin() as conn:
+        await conn.execute(CLEAR_SEARCH_INDEX_SQL)
+        indexed = (await conn.execute(FILL_SEARCH_INDEX_SQL)).rowcount
+        await conn.execute(OPTIMIZE_SEARCH_INDEX_SQL)
+        return indexed
+
+
+async def find_drifted_todo_stats(engine: AsyncEngine) -> list[int]:
+    """Ids of users whose stored todo counts don't match their todos"""
+    async with engine.connect() as conn:
+        return list((await conn.execute(FIND_DRIFTED_TODO_STATS_SQL)).scalars())
+
+
+async def rebuild_todo_stats(engine: AsyncEngine) -> int:
+    """Recount every user's todos from scratch, returns how many users have stats"""
+    async with engine.begin() as conn:
+        await conn.execute(CLEAR_TODO_STATS_SQL)
+        await conn.execute(CLEAR_TODO_DUE_COUNTS_SQL)
+        users = (await conn.execute(FILL_TODO_STATS_SQL)).rowcount
+        await conn.execute(FILL_TODO_DUE_COUNTS_SQL)
+        return users
 
 
 @deps.dep
 class TodoRepo:
-    def __init__(self, db: AsyncEngine, auth_user: AuthUser) -> None:
+    def __init__(
+        self, db: AsyncEngine, db_writer: DbWriter, response_cache: ResponseCache, auth_user: AuthUser
+    ) -> None:
         self.db = db
+        self.db_writer = db_writer
+        self.response_cache = response_cache
         self.auth_user = auth_user
 
-    async def get_todos(self, get_todos_request: GetTodosRequest) -> list[Todo]:
-        sql = """
-        SELECT * FROM todos
-        WHERE user_id = :user_id
+    async def get_todos(self, get_todos_request: GetTodosRequest) -> TodoPage:
+        statement, params = get_todos_query(self.auth_user.user_id, get_todos_request)
+        async with self.db.connect() as conn:
+            rows = await conn.execute(statement, params)
+            todos = decode_all(rows, Todo)
+
+        limit = get_todos_request.limit
+        if limit is not None and len(todos) > limit:
+            return TodoPage(todos[:limit], todos[limit - 1].todo_id)
+        return TodoPage(todos, None)
+
+    async def get_encoded_todos(self, get_todos_request: GetTodosRequest, version: int) -> EncodedTodoPage:
+        """``get_todos`` encoded as JSON, read through the response cache
+
+        ``version`` must have been read before calling, so a concurrent write can only make the cached page newer
+        than its key, never older.
         """
+        key = get_listing_key(version, get_todos_request)
+        page = await self.response_cache.get(self.auth_user.user_id, key)
+        if page is None:
+            todo_page = await self.get_todos(get_todos_request)
+            page = EncodedTodoPage(_encoder.encode(todo_page.todos), todo_page.next_cursor)
+            await self.response_cache.put(self.auth_user.user_id, key, page)
+        return page
 
-        params = {"user_id": self.auth_user.user_id}
-        if get_todos_request.complete is not None:
-            sql += " AND complete = :complete"
-            params["complete"] = get_todos_request.complete
+    async def search_todos(self, query: str, limit: int, offset: int) -> TodoSearchPage:
+        match = get_search_match(self.auth_user.user_id, query)
+        if match is None:
+            return TodoSearchPage([], None)
+        # Fetch one extra row to find out whether there's another page
+        params = {"match": match, "user_id": self.auth_user.user_id, "limit": limit + 1, "offset": offset}
+        async with self.db.connect() as conn:
+            todos = decode_all(await conn.execute(SEARCH_TODOS_SQL, params), Todo)
+        if len(todos) > limit:
+            return TodoSearchPage(todos[:limit], offset + limit)
+        return TodoSearchPage(todos, None)
 
+    async def get_stats(self) -> TodoStats:
+        params = {"user_id": self.auth_user.user_id, "today": date.today()}
         async with self.db.connect() as conn:
-            rows = await conn.execute(text(sql), params)
-            return [msgspec.convert(camelize_row_mapping(r), Todo, strict=False) for r in rows.mappings().fetchall()]
+            return decode_one(await conn.execute(GET_TODO_STATS_SQL, params), TodoStats)
 
-    async def create_todo(self, create_todo_request: CreateTodoRequest) -> Todo:
-        sql = """
-        INSERT INTO todos (user_id, title, description, due_date)
-        VALUES (:user_id, :title, :description, :due_date)
-        RETURNING *
-        """
+    async def get_version(self) -> int:
+        """The user's todos version, changes whenever one of their todos is created, updated or deleted"""
         async with self.db.connect() as conn:
-            async with conn.begin():
-                rows = await conn.execute(
-                    text(sql), msgspec.structs.asdict(create_todo_request) | {"user_id": self.auth_user.user_id}
-                )
-                return msgspec.convert(camelize_row_mapping(rows.mappings().one()), Todo, strict=False)
+            rows = await conn.execute(GET_TODO_VERSION_SQL, {"user_id": self.auth_user.user_id})
+            return rows.scalar_one_or_none() or 0
+
+    async def stream_todos(self, get_todos_request: GetTodosRequest, batch_size: int) -> AsyncIterator[list[Todo]]:
+        """Yield todos in batches from a server-side cursor, so the whole result is never held in memory"""
+        statement, params = get_todos_query(self.auth_user.user_id, get_todos_request)
+        async with self.db.connect() as conn:
+            result = await conn.stream(statement, params)
+            decoder = get_row_decoder(result.keys(), Todo)
+            async for partition in result.partitions(batch_size):
+                yield [decoder(row) for row in partition]
+
+    async def create_todo(self, create_todo_request: CreateTodoRequest) -> Todo:
+        params = msgspec.structs.asdict(create_todo_request) | {"user_id": self.auth_user.user_id}
+
+        async def write(conn: AsyncConnection) -> Todo:
+            return decode_one(await conn.execute(CREATE_TODO_SQL, params), Todo)
+
+        return await self._submit(write)
 
     async def update_todo(self, todo_id: int, update_todo_request: UpdateTodoRequest) -> Todo:
-        sql = """
-        UPDATE todos
-        SET complete = :complete
-        WHERE todo_id = :todo_id
-        AND user_id = :user_id
-        RETURNING *
-        """
+        params = msgspec.structs.asdict(update_todo_request) | {"todo_id": todo_id, "user_id": self.auth_user.user_id}
 
-        async with self.db.connect() as conn:
-            async with conn.begin():
-                rows = await conn.execute(
-                    text(sql),
-                    msgspec.structs.asdict(update_todo_request)
-                    | {"todo_id": todo_id, "user_id": self.auth_user.user_id},
-                )
-                return msgspec.convert(camelize_row_mapping(rows.mappings().one()), Todo, strict=False)
+        async def write(conn: AsyncConnection) -> Todo:
+            return decode_one(await conn.execute(UPDATE_TODO_SQL, params), Todo)
+
+        return await self._submit(write)
 
     async def delete_todo(self, todo_id: int) -> Todo:
-        sql = """
-        DELETE FROM todos
-        WHERE todo_id = :todo_id
-        AND user_id = :user_id
-        RETURNING *
-        """
+        params = {"todo_id": todo_id, "user_id": self.auth_user.user_id}
 
-        async with self.db.connect() as conn:
-            async with conn.begin():
-                rows = await conn.execute(text(sql), {"todo_id": todo_id, "user_id": self.auth_user.user_id})
-                return msgspec.convert(camelize_row_mapping(rows.mappings().one()), Todo, strict=False)
+        async def write(conn: AsyncConnection) -> Todo:
+            return decode_one(await conn.execute(DELETE_TODO_SQL, params), Todo)
+
+        return await self._submit(write)
+
+    async def _submit(self, write: WriteOp[T]) -> T:
+        try:
+            return await self.db_writer.submit(write)
+        finally:
+            await self.response_cache.invalidate_user(self.auth_user.user_id)
+
+    async def _get_todos_by_id(self, conn: AsyncConnection, todo_ids: list[int]) -> dict[int, Todo]:
+        rows = await conn.execute(GET_TODOS_BY_ID_SQL, {"user_id": self.auth_user.user_id, "todo_ids": todo_ids})
+        return {todo.todo_id: todo for todo in decode_all(rows, Todo)}
+
+    async def create_todos(self, create_todo_requests: list[CreateTodoRequest]) -> list[BatchTodoResult]:
+        params = [msgspec.structs.asdict(r) | {"user_id": self.auth_user.user_id} for r in create_todo_requests]
+
+        async def write(conn: AsyncConnection) -> list[Todo]:
+            # Other workers' connections can insert until this transaction holds the write lock, which the first
+            # INSERT takes. From then on the new rows are exactly the ones after the first, in insert order
+            first = decode_one(await conn.execute(CREATE_TODO_SQL, params[0]), Todo)
+            if len(params) == 1:
+                return [first]
+            await conn.execute(BATCH_CREATE_TODO_SQL, params[1:])
+            rows = await conn.execute(
+                TODOS_CREATED_AFTER_SQL, {"user_id": self.auth_user.user_id, "after": first.todo_id}
+            )
+            return [first, *decode_all(rows, Todo)]
+
+        if not params:
+            return []
+        return [BatchTodoResult(True, todo) for todo in await self._submit(write)]
+
+    async def update_todos(self, update_todo_requests: list[BatchUpdateTodoRequest]) -> list[BatchTodoResult]:
+        todo_ids = [r.todo_id for r in update_todo_requests]
+
+        async def write(conn: AsyncConnection) -> dict[int, Todo]:
+            params = [msgspec.structs.asdict(r) | {"user_id": self.auth_user.user_id} for r in update_todo_requests]
+            await conn.execute(BATCH_UPDATE_TODO_SQL, params)
+            return await self._get_todos_by_id(conn, todo_ids)
+
+        if not todo_ids:
+            return []
+        updated = await self._submit(write)
+        return [
+            BatchTodoResult(True, updated[todo_id])
+            if todo_id in updated
+            else BatchTodoResult(False, None, TODO_NOT_FOUND)
+            for todo_id in todo_ids
+        ]
+
+    async def delete_todos(self, todo_ids: list[int]) -> list[BatchTodoResult]:
+        async def write(conn: AsyncConnection) -> dict[int, Todo]:
+            deleted = await self._get_todos_by_id(conn, todo_ids)
+            params = [{"todo_id": todo_id, "user_id": self.auth_user.user_id} for todo_id in deleted]
+            if params:
+                await conn.execute(BATCH_DELETE_TODO_SQL, params)
+            return deleted
+
+        if not todo_ids:
+            return []
+        deleted = await self._submit(write)
+        # Only the first occurrence of a repeated id reports the deleted todo
+        results = []
+        for todo_id in todo_ids:
+            todo = deleted.pop(todo_id, None)
+            results.append(BatchTodoResult(True, todo) if todo else BatchTodoResult(False, None, TODO_NOT_FOUND))
+        return results
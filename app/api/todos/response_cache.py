@@ -0,0 +1,135 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Literal, Optional
+
+import msgspec
+
+# Rough bookkeeping cost of an entry on top of its body, so lots of tiny pages still count against the cap
+ENTRY_OVERHEAD_BYTES = 256
+
+
+class EncodedTodoPage(msgspec.Struct, frozen=True):
+    # A page of todos already encoded as a JSON array
+    body: bytes
+    next_cursor: Optional[int]
+
+
+class ResponseCacheStats(msgspec.Struct):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    entries: int
+    size_bytes: int
+    max_bytes: int
+
+
+class ResponseCache(ABC):
+    """Encoded todo pages per user, keyed by the user's todos version and the listing's filters
+
+    Keys include the version, so an entry can never be served after a write, even one made by another worker.
+    ``invalidate_user`` only frees the entries a write made unreachable. Methods are async so a store shared
+    between workers can implement them.
+    """
+
+    @abstractmethod
+    async def get(self, user_id: int, key: str) -> Optional[EncodedTodoPage]:
+        ...
+
+    @abstractmethod
+    async def put(self, user_id: int, key: str, page: EncodedTodoPage) -> None:
+        ...
+
+    @abstractmethod
+    async def invalidate_user(self, user_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def stats(self) -> ResponseCacheStats:
+        ...
+
+
+class InMemoryResponseCache(ResponseCache):
+    """LRU cache of encoded pages in this process, evicting least recently used entries past ``max_bytes``"""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[int, str], EncodedTodoPage] = OrderedDict()
+        self._keys_by_user: dict[int, set[str]] = {}
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def get(self, user_id: int, key: str) -> Optional[EncodedTodoPage]:
+        page = self._entries.get((user_id, key))
+        if page is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((user_id, key))
+        self.hits += 1
+        return page
+
+    async def put(self, user_id: int, key: str, page: EncodedTodoPage) -> None:
+        if len(page.body) + ENTRY_OVERHEAD_BYTES > self.max_bytes:
+            return
+        self._remove((user_id, key))
+        self._entries[(user_id, key)] = page
+        self._keys_by_user.setdefault(user_id, set()).add(key)
+        self.size_bytes += len(page.body) + ENTRY_OVERHEAD_BYTES
+        while self.size_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def invalidate_user(self, user_id: int) -> None:
+        keys = self._keys_by_user.get(user_id)
+        if keys:
+            self.invalidations += len(keys)
+            for key in list(keys):
+                self._remove((user_id, key))
+
+    async def stats(self) -> ResponseCacheStats:
+        return ResponseCacheStats(
+            self.hits,
+            self.misses,
+            self.evictions,
+            self.invalidations,
+            len(self._entries),
+            self.size_bytes,
+            self.max_bytes,
+        )
+
+    def _remove(self, entry_key: tuple[int, str]) -> None:
+        page = self._entries.pop(entry_key, None)
+        if page is None:
+            return
+        self.size_bytes -= len(page.body) + ENTRY_OVERHEAD_BYTES
+        user_id, key = entry_key
+        keys = self._keys_by_user[user_id]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_user[user_id]
+
+
+class NoResponseCache(ResponseCache):
+    """Caches nothing, for turning the cache off"""
+
+    async def get(self, user_id: int, key: str) -> Optional[EncodedTodoPage]:
+        return None
+
+    async def put(self, user_id: int, key: str, page: EncodedTodoPage) -> None:
+        ...
+
+    async def invalidate_user(self, user_id: int) -> None:
+        ...
+
+    async def stats(self) -> ResponseCacheStats:
+        return ResponseCacheStats(0, 0, 0, 0, 0, 0, 0)
+
+
+def create_response_cache(backend: Literal["memory", "none"], max_bytes: int) -> ResponseCache:
+    if backend == "none":
+        return NoResponseCache()
+    return InMemoryResponseCache(max_bytes)
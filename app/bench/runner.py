@@ -0,0 +1,103 @@
+import asyncio
+import math
+import platform
+import time
+from datetime import UTC, datetime
+from typing import Optional
+
+import httpx
+import msgspec
+
+from app.bench.scenarios import SCENARIOS, Scenario, VirtualUser, create_user
+
+
+class ScenarioResult(msgspec.Struct):
+    name: str
+    requests: int
+    errors: int
+    duration_seconds: float
+    throughput_rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+class BenchReport(msgspec.Struct):
+    started_at: datetime
+    target: str
+    concurrency: int
+    requests_per_scenario: int
+    python_version: str
+    results: list[ScenarioResult]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, name: str, scenario: Scenario, users: list[VirtualUser], requests: int
+) -> ScenarioResult:
+    """Make ``requests`` requests spread over one worker per user, all running concurrently"""
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker(user: VirtualUser, count: int) -> None:
+        nonlocal errors
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, user)
+                failed = response.is_error
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    per_worker, remainder = divmod(requests, len(users))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(user, per_worker + (i < remainder)) for i, user in enumerate(users)))
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    return ScenarioResult(
+        name=name,
+        requests=len(latencies),
+        errors=errors,
+        duration_seconds=duration,
+        throughput_rps=len(latencies) / duration if duration else 0.0,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p95_ms=percentile(latencies, 95) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+    )
+
+
+async def run_bench(
+    client: httpx.AsyncClient, target: str, concurrency: int, requests: int, scenario_names: Optional[list[str]] = None
+) -> BenchReport:
+    started_at = datetime.now(tz=UTC)
+    users = list(await asyncio.gather(*(create_user(client) for _ in range(concurrency))))
+    results = []
+    for name, scenario in SCENARIOS.items():
+        if scenario_names and name not in scenario_names:
+            continue
+        results.append(await run_scenario(client, name, scenario, users, requests))
+    return BenchReport(started_at, target, concurrency, requests, platform.python_version(), results)
+
+
+def compare(baseline: BenchReport, current: BenchReport) -> list[str]:
+    """One line per scenario in both reports with the change in throughput and p95"""
+    baseline_results = {result.name: result for result in baseline.results}
+    lines = []
+    for result in current.results:
+        old = baseline_results.get(result.name)
+        if not old or not old.throughput_rps or not old.p95_ms:
+            continue
+        throughput_change = (result.throughput_rps / old.throughput_rps - 1) * 100
+        p95_change = (result.p95_ms / old.p95_ms - 1) * 100
+        lines.append(f"{result.name:<12} throughput {throughput_change:+7.1f}%  p95 {p95_change:+7.1f}%")
+    return lines
@@ -0,0 +1,88 @@
+import itertools
+import uuid
+from typing import Awaitable, Callable
+
+import httpx
+
+# Unique per process, so repeated runs against the same database don't collide on emails
+_run_id = uuid.uuid4().hex[:8]
+_counter = itertools.count()
+
+BENCH_PASSWORD = "bench-password"
+
+
+class VirtualUser:
+    """One simulated client, with its own account and the todos it created"""
+
+    def __init__(self, email: str) -> None:
+        self.email = email
+        self.headers: dict[str, str] = {}
+        self.todo_ids: list[int] = []
+
+
+def new_email() -> str:
+    return f"bench-{_run_id}-{next(_counter)}@example.com"
+
+
+async def create_user(client: httpx.AsyncClient) -> VirtualUser:
+    user = VirtualUser(new_email())
+    (await register_user(client, user.email)).raise_for_status()
+    response = await login_user(client, user.email)
+    response.raise_for_status()
+    user.headers = {"Authorization": response.json()["accessToken"]}
+    return user
+
+
+async def register_user(client: httpx.AsyncClient, email: str) -> httpx.Response:
+    return await client.post("/api/auth/register", json={"email": email, "password": BENCH_PASSWORD})
+
+
+async def login_user(client: httpx.AsyncClient, email: str) -> httpx.Response:
+    return await client.post("/api/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+
+
+# Each scenario makes exactly one timed request as `user`
+
+
+async def register(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    return await register_user(client, new_email())
+
+
+async def login(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    return await login_user(client, user.email)
+
+
+async def create_todo(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    response = await client.post(
+        "/api/todos/", json={"title": "Bench todo", "description": "Created by app bench"}, headers=user.headers
+    )
+    if response.is_success:
+        user.todo_ids.append(response.json()["todoId"])
+    return response
+
+
+async def list_todos(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    return await client.get("/api/todos/", headers=user.headers)
+
+
+async def update_todo(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    todo_id = user.todo_ids[len(user.todo_ids) // 2] if user.todo_ids else 0
+    return await client.put(f"/api/todos/{todo_id}", json={"complete": True}, headers=user.headers)
+
+
+async def delete_todo(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    todo_id = user.todo_ids.pop() if user.todo_ids else 0
+    return await client.delete(f"/api/todos/{todo_id}", headers=user.headers)
+
+
+Scenario = Callable[[httpx.AsyncClient, VirtualUser], Awaitable[httpx.Response]]
+
+# In the order they run - creating todos first leaves something to update and delete
+SCENARIOS: dict[str, Scenario] = {
+    "register": register,
+    "login": login,
+    "create_todo": create_todo,
+    "list_todos": list_todos,
+    "update_todo": update_todo,
+    "delete_todo": delete_todo,
+}
@@ -0,0 +1,86 @@
+from datetime import UTC, date, datetime, timedelta
+
+import msgspec
+from argon2 import PasswordHasher
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.common.get_log import get_logger
+
+_logger = get_logger()
+
+SEED_PASSWORD = "seed-password"
+CHUNK_SIZE = 10_000
+
+INSERT_USER_SQL = """
+INSERT OR IGNORE INTO users (email, hashed_password, created_at)
+VALUES (:email, :hashed_password, :created_at)
+"""
+
+FIND_USER_IDS_SQL = text(
+    """
+    SELECT user_id FROM users
+    WHERE email IN :emails
+    """
+).bindparams(bindparam("emails", expanding=True))
+
+INSERT_TODO_SQL = """
+INSERT INTO todos (user_id, title, description, due_date, complete)
+VALUES (:user_id, :title, :description, :due_date, :complete)
+"""
+
+
+class SeedResult(msgspec.Struct):
+    users: int
+    todos: int
+
+
+def seed_email(index: int) -> str:
+    return f"seed-user-{index}@example.com"
+
+
+async def seed_db(engine: AsyncEngine, users: int, todos_per_user: int) -> SeedResult:
+    """Create ``users`` users (all with ``SEED_PASSWORD``) and add ``todos_per_user`` todos to each
+
+    Users that already exist are reused, so running it again only adds todos.
+    """
+    # Hashing is the slow part of registering, every seeded user shares one hash
+    hashed_password = PasswordHasher().hash(SEED_PASSWORD)
+    created_at = datetime.now(tz=UTC)
+    todos = 0
+    async with engine.connect() as conn:
+        for start in range(0, users, CHUNK_SIZE):
+            emails = [seed_email(i) for i in range(start, min(start + CHUNK_SIZE, users))]
+            async with conn.begin():
+                await conn.execute(
+                    text(INSERT_USER_SQL),
+                    [
+                        {"email": email, "hashed_password": hashed_password, "created_at": created_at}
+                        for email in emails
+                    ],
+                )
+                user_ids = (await conn.execute(FIND_USER_IDS_SQL, {"emails": emails})).scalars().all()
+
+            batch: list[dict] = []
+            for user_id in user_ids:
+                for i in range(todos_per_user):
+                    batch.append(
+                        {
+                            "user_id": user_id,
+                            "title": f"Todo {i}",
+                            "description": f"Seeded todo {i} for user {user_id}",
+                            "due_date": date.today() + timedelta(days=i % 60 - 30) if i % 3 else None,
+                            "complete": i % 4 == 0,
+                        }
+                    )
+                    if len(batch) >= CHUNK_SIZE:
+                        async with conn.begin():
+                            await conn.execute(text(INSERT_TODO_SQL), batch)
+                        todos += len(batch)
+                        batch = []
+            if batch:
+                async with conn.begin():
+                    await conn.execute(text(INSERT_TODO_SQL), batch)
+                todos += len(batch)
+            _logger.info(f"Seeded {min(start + CHUNK_SIZE, users)}/{users} users")
+    return SeedResult(users, todos)
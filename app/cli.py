@@ -1,58 +1,284 @@
 import asyncio
+import importlib.util
 import os
 import subprocess
 import sys
+import tempfile
+from contextlib import ExitStack
 from pathlib import Path
+from typing import Awaitable, Callable, Optional, TypeVar
 
 import click
-from sqlalchemy.ext.asyncio import create_async_engine
+import httpx
+import msgspec
+import uvicorn
+from litestar.testing import AsyncTestClient
+from sqlalchemy.ext.asyncio import AsyncEngine
 
+from app import app
+from app.bench.runner import BenchReport, compare, run_bench
+from app.bench.scenarios import SCENARIOS
+from app.bench.seed import SEED_PASSWORD, seed_db
+from app.api.todos.repo import find_drifted_todo_stats, rebuild_search_index, rebuild_todo_stats
+from app.common.db import create_db_engine, get_db_path
 from app.common.get_log import get_logger
-from app.setup_db import setup_db
+from app.common.settings import Settings
+from app.common.static_assets import build_static_assets
+from app.query_plans import explain_hot_queries
+from app.setup_db import LATEST_VERSION, get_schema_version, migrate, setup_db
 
 _log = get_logger()
 
+T = TypeVar("T")
+
+settings = Settings.from_env()
+
 
 @click.group()
 def cli() -> None:
     ...
 
 
-def run_db_setup() -> None:
+def run_with_engine(fn: Callable[[AsyncEngine], Awaitable[T]], db_settings: Settings = settings) -> T:
+    async def run() -> T:
+        db_engine = create_db_engine(db_settings)
+        try:
+            return await fn(db_engine)
+        finally:
+            await db_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def run_db_setup(db_settings: Settings = settings) -> None:
     _log.info("Setting up db")
-    db_engine = create_async_engine("sqlite+aiosqlite:///data.db")
-    fut = setup_db(db_engine)
-    asyncio.run(fut)
+    run_with_engine(setup_db, db_settings)
     _log.info("Finished setting up db")
 
 
+def db_exists() -> bool:
+    db_path = get_db_path(settings)
+    return db_path is not None and db_path.exists()
+
+
+def remove_db() -> None:
+    db_path = get_db_path(settings)
+    if db_path is None:
+        return
+    # In WAL mode uncheckpointed writes live in the -wal file, it has to go with the database
+    for path in (db_path, Path(f"{db_path}-wal"), Path(f"{db_path}-shm")):
+        if path.exists():
+            os.remove(path)
+
+
 @cli.command(name="init-db", help="Initialize the database if it does not exist")
 def init_db() -> None:
-    if Path("data.db").exists():
-        raise Exception("data.db already exists, try clearing database first with 'clear-db' command")
+    if db_exists():
+        raise Exception(f"{get_db_path(settings)} already exists, try clearing database first with 'clear-db' command")
     run_db_setup()
 
 
 @cli.command(name="clear-db", help="Clear the database")
 def delete_db() -> None:
-    os.remove("./data.db")
+    remove_db()
     run_db_setup()
 
 
+@cli.command(name="migrate", help="Apply pending database migrations")
+@click.option("--to", "target_version", type=int, default=None, help="Migrate up to this version instead of the latest")
+def migrate_db(target_version: Optional[int]) -> None:
+    async def run(db_engine: AsyncEngine) -> None:
+        applied = await migrate(db_engine, target_version)
+        version = await get_schema_version(db_engine)
+        _log.info(f"Applied {len(applied)} migration(s), schema is at version {version} (latest {LATEST_VERSION})")
+
+    run_with_engine(run)
+
+
+@cli.command(name="explain-queries", help="Check that every repo query is served by an index")
+def explain_queries() -> None:
+    async def run(db_engine: AsyncEngine) -> bool:
+        await setup_db(db_engine)
+        plans = await explain_hot_queries(db_engine)
+        for plan in plans:
+            click.echo(f"{'OK  ' if plan.uses_index else 'SCAN'} {plan.name}: {'; '.join(plan.details)}")
+        return all(plan.uses_index for plan in plans)
+
+    if not run_with_engine(run):
+        raise click.ClickException("Some queries aren't served by an index")
+
+
+@cli.command(name="rebuild-search-index", help="Re-index every todo for full-text search")
+def rebuild_search() -> None:
+    run_db_setup()
+
+    async def run(db_engine: AsyncEngine) -> None:
+        _log.info(f"Indexed {await rebuild_search_index(db_engine)} todos")
+
+    run_with_engine(run)
+
+
+@cli.command(name="check-todo-stats", help="Check the per-user todo counts against the todos table")
+@click.option("--rebuild", is_flag=True, help="Recount every user's todos when any counts have drifted")
+def check_todo_stats(rebuild: bool) -> None:
+    run_db_setup()
+
+    async def run(db_engine: AsyncEngine) -> list[int]:
+        drifted = await find_drifted_todo_stats(db_engine)
+        if drifted and rebuild:
+            _log.info(f"Rebuilt todo stats for {await rebuild_todo_stats(db_engine)} users")
+        return drifted
+
+    drifted = run_with_engine(run)
+    if not drifted:
+        _log.info("Todo stats match the todos table")
+        return
+    _log.warning(f"Todo stats drifted for {len(drifted)} users: {', '.join(map(str, drifted[:20]))}")
+    if not rebuild:
+        raise click.ClickException("Todo stats don't match the todos table, rerun with --rebuild to fix them")
+
+
+@cli.command(name="build-static", help="Fingerprint and precompress the static files for serving")
+def build_static() -> None:
+    manifest = build_static_assets(Path(settings.static_source_dir), Path(settings.static_build_dir))
+    for name, fingerprinted_name in manifest.assets.items():
+        _log.info(f"{name} -> {fingerprinted_name}")
+    _log.info(f"Built {len(manifest.assets)} static assets into {settings.static_build_dir}")
+
+
+@cli.command(name="seed", help="Fill the database with generated users and todos")
+@click.option("--users", type=int, default=100, show_default=True)
+@click.option("--todos-per-user", type=int, default=100, show_default=True)
+def seed(users: int, todos_per_user: int) -> None:
+    run_db_setup()
+
+    async def run(db_engine: AsyncEngine) -> None:
+        result = await seed_db(db_engine, users, todos_per_user)
+        _log.info(f"Seeded {result.users} users and {result.todos} todos, every user's password is '{SEED_PASSWORD}'")
+
+    run_with_engine(run)
+
+
+@cli.command(name="bench", help="Load test the API and report throughput and latency per endpoint")
+@click.option("--url", default=None, help="Server to test, e.g. http://127.0.0.1:8000. Defaults to the app in-process")
+@click.option("--concurrency", type=int, default=10, show_default=True, help="Simulated clients")
+@click.option("--requests", type=int, default=200, show_default=True, help="Requests per scenario")
+@click.option(
+    "--scenario", "scenarios", multiple=True, type=click.Choice(list(SCENARIOS)), help="Only run these scenarios"
+)
+@click.option("--output", type=click.Path(dir_okay=False), default=None, help="Write the results as JSON")
+@click.option("--compare", "baseline", type=click.Path(exists=True, dir_okay=False), help="Earlier JSON results")
+@click.option(
+    "--configured-db",
+    is_flag=True,
+    default=False,
+    help="Run in-process against APP_DATABASE_URL, e.g. after `app seed`, instead of a temporary database",
+)
+def bench(
+    url: Optional[str],
+    concurrency: int,
+    requests: int,
+    scenarios: tuple[str, ...],
+    output: Optional[str],
+    baseline: Optional[str],
+    configured_db: bool,
+) -> None:
+    async def run() -> BenchReport:
+        if url:
+            async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+                return await run_bench(client, url, concurrency, requests, list(scenarios))
+
+        async with AsyncTestClient(app, timeout=60) as test_client:
+            return await run_bench(test_client, "in-process", concurrency, requests, list(scenarios))
+
+    with ExitStack() as stack:
+        if not url:
+            # Every simulated client shares the test client's address, they'd all be throttled by the first few logins
+            os.environ.setdefault("APP_LOGIN_THROTTLE_BACKEND", "none")
+            if not configured_db:
+                # The users and todos a run creates stay in the database, so by default they go to one thrown away
+                # afterwards. The app reads the URL from the environment on startup
+                temp_dir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="app-bench-")))
+                os.environ["APP_DATABASE_URL"] = f"sqlite+aiosqlite:///{temp_dir / 'bench.db'}"
+            run_db_setup(Settings.from_env())
+        report = asyncio.run(run())
+    click.echo(f"{'scenario':<12} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in report.results:
+        click.echo(
+            f"{r.name:<12} {r.requests:>8} {r.errors:>6} {r.throughput_rps:>9.1f} "
+            f"{r.p50_ms:>8.2f} {r.p95_ms:>8.2f} {r.p99_ms:>8.2f}"
+        )
+    if baseline:
+        click.echo(f"\nCompared to {baseline}:")
+        for line in compare(msgspec.json.decode(Path(baseline).read_bytes(), type=BenchReport), report):
+            click.echo(line)
+    if output:
+        Path(output).write_bytes(msgspec.json.format(msgspec.json.encode(report)))
+
+
+def pick_implementations() -> tuple[str, str]:
+    """The fastest installed event loop and HTTP parser, falling back to the pure python ones"""
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    return loop, http
+
+
 @cli.command(name="start", help="Start the app")
-@click.option("--port", type=int, default=8000)
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=8000, show_default=True)
 @click.option("--clear-db", is_flag=True, show_default=True, default=False, help="Clear the database on startup")
-def start(port: int, clear_db: bool) -> None:
+@click.option("--prod", is_flag=True, default=False, help="Serve with multiple workers and no reloader")
+@click.option("--workers", type=int, default=0, help="Worker processes in --prod mode, 0 means one per cpu")
+@click.option("--backlog", type=int, default=2048, show_default=True, help="Max queued connections in --prod mode")
+@click.option(
+    "--keepalive", type=int, default=5, show_default=True, help="Keep-alive timeout in seconds in --prod mode"
+)
+@click.option(
+    "--limit-concurrency",
+    type=int,
+    default=None,
+    help="Max concurrent connections per worker in --prod mode before responding 503",
+)
+def start(
+    host: str,
+    port: int,
+    clear_db: bool,
+    prod: bool,
+    workers: int,
+    backlog: int,
+    keepalive: int,
+    limit_concurrency: Optional[int],
+) -> None:
     if clear_db:
         _log.info("Clearing DB")
-        os.remove("./data.db")
-        run_db_setup()
-    if not Path("./data.db").exists():
+        remove_db()
+    if not db_exists():
         _log.info("DB doesn't exist yet, creating")
-        run_db_setup()
-    subprocess.run(
-        [sys.executable, "-m", "uvicorn", "app:app", "--reload", "--port", str(port)],
-        check=True,
+    # Migrate once here rather than racing to do it in every worker's startup hook
+    run_db_setup()
+
+    if not prod:
+        subprocess.run(
+            [sys.executable, "-m", "uvicorn", "app:app", "--reload", "--host", host, "--port", str(port)],
+            check=True,
+        )
+        return
+
+    os.environ["APP_MIGRATE_ON_STARTUP"] = "false"
+    workers = workers or os.cpu_count() or 1
+    loop, http = pick_implementations()
+    _log.info(f"Starting {workers} worker(s) on {host}:{port} with loop={loop} http={http}")
+    uvicorn.run(
+        "app:app",
+        host=host,
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=backlog,
+        timeout_keep_alive=keepalive,
+        limit_concurrency=limit_concurrency,
+        reload=False,
     )
 
 
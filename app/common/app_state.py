@@ -1,16 +1,40 @@
+import asyncio
 from typing import Optional
 
 import msgspec
-from argon2 import PasswordHasher
 from sqlalchemy.ext.asyncio import AsyncEngine
 
-from app.api.auth.models import AuthUser
+from app.api.auth.hasher import AsyncPasswordHasher
 from app.api.auth.repo import AuthRepo
+from app.api.auth.signed_token import RevocationList, TokenSigner
+from app.api.auth.throttle import LoginThrottle
+from app.api.auth.token_cache import TokenCache
+from app.api.auth.token_sweeper import TokenSweeper
+from app.api.todos.response_cache import ResponseCache
+from app.common.db_writer import DbWriter
+from app.common.metrics import Metrics
+from app.common.profiling import RequestProfiler
+from app.common.settings import Settings
+from app.common.static_assets import StaticAssets
 
 
 class AppState(msgspec.Struct):
+    settings: Settings
     db: AsyncEngine
-    password_hasher: PasswordHasher
+    db_writer: DbWriter
+    password_hasher: AsyncPasswordHasher
     # We need a version of the auth service in state to access it from auth middleware
     auth_repo: AuthRepo
-    auth_user: Optional[AuthUser]
+    token_cache: TokenCache
+    token_sweeper: TokenSweeper
+    response_cache: ResponseCache
+    revocation_list: RevocationList
+    login_throttle: LoginThrottle
+    static_assets: StaticAssets
+    # Only set when signed tokens are enabled
+    token_signer: Optional[TokenSigner]
+    # Only set when metrics are enabled
+    metrics: Optional[Metrics] = None
+    # Only set when profiling is enabled
+    profiler: Optional[RequestProfiler] = None
+    background_tasks: list[asyncio.Task] = msgspec.field(default_factory=list)
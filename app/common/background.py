@@ -0,0 +1,26 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from app.common.get_log import get_logger
+
+_logger = get_logger()
+
+
+async def run_periodically(interval_seconds: float, fn: Callable[[], Awaitable[object]]) -> None:
+    """Call ``fn`` every ``interval_seconds`` until cancelled, logging (not raising) failures"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await fn()
+        except Exception as ex:
+            _logger.exception(str(ex))
+
+
+def start_periodic_task(interval_seconds: float, fn: Callable[[], Awaitable[object]], name: str) -> asyncio.Task:
+    return asyncio.create_task(run_periodically(interval_seconds, fn), name=name)
+
+
+async def cancel_tasks(tasks: list[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,115 @@
+from pathlib import Path
+from typing import Any, Optional, cast
+
+import msgspec
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.engine.default import DefaultDialect
+from sqlalchemy.engine.interfaces import DBAPIConnection
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, Pool
+
+from app.common.metrics import Metrics
+from app.common.settings import Settings
+
+
+class SqliteProfile(msgspec.Struct, frozen=True):
+    journal_mode: Optional[str] = None
+    synchronous: Optional[str] = None
+    busy_timeout_ms: Optional[int] = None
+    # Negative values are KiB, positive values are pages
+    cache_size: Optional[int] = None
+    mmap_size_bytes: Optional[int] = None
+    temp_store: Optional[str] = None
+
+
+PROFILES: dict[str, SqliteProfile] = {
+    # SQLite's own defaults
+    "default": SqliteProfile(),
+    # WAL lets readers carry on while a write is in progress and synchronous=NORMAL only fsyncs on checkpoints,
+    # which is still safe against corruption in WAL mode
+    "performance": SqliteProfile(
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        busy_timeout_ms=5000,
+        cache_size=-64_000,
+        mmap_size_bytes=256 * 1024 * 1024,
+        temp_store="MEMORY",
+    ),
+}
+
+
+def get_profile(settings: Settings) -> SqliteProfile:
+    profile = PROFILES[settings.db_profile]
+    overrides = {
+        "busy_timeout_ms": settings.db_busy_timeout_ms,
+        "cache_size": settings.db_cache_size,
+        "mmap_size_bytes": settings.db_mmap_size_bytes,
+    }
+    return msgspec.structs.replace(profile, **{k: v for k, v in overrides.items() if v is not None})
+
+
+def get_pragmas(profile: SqliteProfile) -> list[str]:
+    pragmas = ["PRAGMA foreign_keys=ON"]
+    # busy_timeout goes first so the rest wait for locks instead of failing
+    if profile.busy_timeout_ms is not None:
+        pragmas.append(f"PRAGMA busy_timeout={profile.busy_timeout_ms}")
+    if profile.journal_mode is not None:
+        pragmas.append(f"PRAGMA journal_mode={profile.journal_mode}")
+    if profile.synchronous is not None:
+        pragmas.append(f"PRAGMA synchronous={profile.synchronous}")
+    if profile.cache_size is not None:
+        pragmas.append(f"PRAGMA cache_size={profile.cache_size}")
+    if profile.mmap_size_bytes is not None:
+        pragmas.append(f"PRAGMA mmap_size={profile.mmap_size_bytes}")
+    if profile.temp_store is not None:
+        pragmas.append(f"PRAGMA temp_store={profile.temp_store}")
+    return pragmas
+
+
+def create_db_engine(settings: Settings, metrics: Optional[Metrics] = None) -> AsyncEngine:
+    """Create the app's engine, applying the configured SQLite profile to every new connection
+
+    With ``metrics`` every statement and pool checkout is timed.
+    """
+    url = make_url(settings.database_url)
+    pool_class: type[Pool]
+    pool_args: dict[str, Any] = {}
+    if get_db_path(settings) is None:
+        pool_class = cast(type[DefaultDialect], url.get_dialect()).get_pool_class(url)
+    else:
+        # SQLAlchemy's default for file databases opens a new connection per checkout, which throws away the
+        # connection's pragmas and sqlite3's prepared statement cache every time
+        pool_class = AsyncAdaptedQueuePool
+        pool_args["pool_size"] = settings.db_pool_size
+    if metrics is not None:
+        pool_class = metrics.timed_pool_class(pool_class)
+    db_engine = create_async_engine(
+        url, poolclass=pool_class, connect_args={"cached_statements": settings.db_cached_statements}, **pool_args
+    )
+    if metrics is not None:
+        metrics.instrument_engine(db_engine.sync_engine)
+    pragmas = get_pragmas(get_profile(settings))
+
+    @event.listens_for(db_engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection: DBAPIConnection, connection_record: ConnectionPoolEntry) -> None:
+        cur = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cur.execute(pragma)
+        cur.close()
+        dbapi_connection.commit()
+
+    return db_engine
+
+
+async def optimize(db_engine: AsyncEngine) -> None:
+    """Let SQLite refresh the statistics the query planner relies on, cheap when nothing changed"""
+    async with db_engine.connect() as conn:
+        await conn.exec_driver_sql("PRAGMA optimize")
+        await conn.commit()
+
+
+def get_db_path(settings: Settings) -> Optional[Path]:
+    """The database file, or None for in-memory databases"""
+    database = make_url(settings.database_url).database
+    return Path(database) if database and database != ":memory:" else None
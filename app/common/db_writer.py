@@ -0,0 +1,122 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+import msgspec
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+T = TypeVar("T")
+
+WriteOp = Callable[[AsyncConnection], Awaitable[T]]
+
+
+class DbWriterStats(msgspec.Struct):
+    batches: int
+    writes: int
+    # Batches where an op failed, so every op was re-run in its own transaction
+    split_batches: int
+    largest_batch: int
+    queue_depth: int
+
+
+class _QueuedWrite(msgspec.Struct):
+    op: WriteOp
+    future: asyncio.Future
+
+
+class DbWriter:
+    """Funnels writes through one task so they don't fight over SQLite's write lock
+
+    Whatever is queued when the writer picks up work runs in a single transaction (group commit), so a burst
+    of writes pays for one commit. If an op fails the transaction is rolled back and each op is re-run in its
+    own transaction, so only the failing caller sees the error. Ops must therefore only touch the database.
+
+    When disabled, or before ``start``/after ``stop``, ``submit`` runs the op in its own transaction inline.
+    """
+
+    def __init__(self, db: AsyncEngine, enabled: bool, max_batch_size: int) -> None:
+        self.db = db
+        self.enabled = enabled
+        self.max_batch_size = max_batch_size
+        self._queue: asyncio.Queue[Optional[_QueuedWrite]] = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.writes = 0
+        self.split_batches = 0
+        self.largest_batch = 0
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="db-writer")
+
+    async def stop(self) -> None:
+        """Commit whatever is still queued, then stop the writer task"""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        self._queue.put_nowait(None)
+        await task
+
+    async def submit(self, op: WriteOp[T]) -> T:
+        if self._task is None:
+            return await self._run_alone(op)
+        future: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_QueuedWrite(op, future))
+        return await future
+
+    def stats(self) -> DbWriterStats:
+        return DbWriterStats(self.batches, self.writes, self.split_batches, self.largest_batch, self._queue.qsize())
+
+    async def _run_alone(self, op: WriteOp[T]) -> T:
+        async with self.db.connect() as conn:
+            async with conn.begin():
+                return await op(conn)
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: list[_QueuedWrite] = []
+            item = await self._queue.get()
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.max_batch_size or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            stopping = item is None
+            if batch:
+                await self._commit(batch)
+
+    async def _commit(self, batch: list[_QueuedWrite]) -> None:
+        batch = [write for write in batch if not write.future.cancelled()]
+        if not batch:
+            return
+        self.batches += 1
+        self.writes += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        results: list[Any] = []
+        try:
+            async with self.db.connect() as conn:
+                async with conn.begin():
+                    for write in batch:
+                        results.append(await write.op(conn))
+        except Exception as ex:
+            if len(batch) == 1:
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(ex)
+                return
+            self.split_batches += 1
+            for write in batch:
+                await self._commit_alone(write)
+            return
+        for write, result in zip(batch, results):
+            if not write.future.done():
+                write.future.set_result(result)
+
+    async def _commit_alone(self, write: _QueuedWrite) -> None:
+        try:
+            result = await self._run_alone(write.op)
+        except Exception as ex:
+            if not write.future.done():
+                write.future.set_exception(ex)
+        else:
+            if not write.future.done():
+                write.future.set_result(result)
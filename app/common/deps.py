@@ -1,36 +1,44 @@
 from dataclasses import dataclass
-from inspect import iscoroutinefunction
-from typing import Callable, Generic, Optional, TypeVar
+from inspect import Parameter, isawaitable, iscoroutinefunction, signature
+from typing import Any, Callable, Generic, Literal, Optional, TypeVar
 
 import inflection
 from litestar.config.app import AppConfig
+from litestar.datastructures import State
 from litestar.di import Provide
 from litestar.plugins import InitPluginProtocol
 
 T = TypeVar("T", bound=Callable)
 
+# singleton: built once by build_singletons, before the first request
+# request: built on every request that needs it, and shared by everything depending on it within that request
+Lifetime = Literal["singleton", "request"]
+
 
 @dataclass
 class Dependency(Generic[T]):
     obj: T
-    use_cache: bool
+    lifetime: Lifetime
 
 
 class DependencyRegistry(InitPluginProtocol):
     def __init__(self) -> None:
         self._dep_registry: dict[str, Dependency] = {}
+        self._singletons: dict[str, Any] = {}
 
     def on_app_init(self, app_config: AppConfig) -> AppConfig:
         app_config.dependencies.update(self.provide())
         return super().on_app_init(app_config)
 
-    def __call__(self, obj: Optional[T] = None, /, *, use_cache: bool = False, rename: Optional[str] = None) -> T:
+    def __call__(
+        self, obj: Optional[T] = None, /, *, lifetime: Lifetime = "request", rename: Optional[str] = None
+    ) -> T:
         def wrap(obj: T) -> T:
             new_name = inflection.underscore(obj.__name__) if not rename else rename
             if new_name in self._dep_registry:
                 raise Exception(f"Dependency '{new_name}' is defined more than once")
 
-            self._dep_registry[new_name] = Dependency(obj, use_cache)
+            self._dep_registry[new_name] = Dependency(obj, lifetime)
             return obj
 
         if obj is None:
@@ -38,13 +46,57 @@ class DependencyRegistry(InitPluginProtocol):
         else:
             return wrap(obj)
 
+    async def build_singletons(self, state: State) -> None:
+        """Build every singleton, resolving their parameters by name from other singletons or the app's ``state``"""
+        self._singletons = {}
+        for name, dependency in self._dep_registry.items():
+            if dependency.lifetime == "singleton":
+                await self._build_singleton(name, state, ())
+
+    async def _build_singleton(self, name: str, state: State, path: tuple[str, ...]) -> Any:
+        if name in self._singletons:
+            return self._singletons[name]
+        if name in path:
+            raise Exception(f"Dependency cycle: {' -> '.join((*path, name))}")
+        dependency = self._dep_registry[name]
+
+        kwargs: dict[str, Any] = {}
+        for param in signature(dependency.obj).parameters.values():
+            if param.name == "state":
+                kwargs["state"] = state
+                continue
+            param_dependency = self._dep_registry.get(param.name)
+            if param_dependency is None and param.default is not Parameter.empty:
+                continue
+            if param_dependency is None or param_dependency.lifetime != "singleton":
+                raise Exception(f"Singleton '{name}' depends on '{param.name}', which isn't a singleton")
+            kwargs[param.name] = await self._build_singleton(param.name, state, (*path, name))
+
+        value = dependency.obj(**kwargs)
+        if isawaitable(value):
+            value = await value
+        self._singletons[name] = value
+        return value
+
+    def _provide_singleton(self, name: str) -> Callable[[], Any]:
+        def provide_singleton() -> Any:
+            try:
+                return self._singletons[name]
+            except KeyError:
+                raise Exception(f"Singleton '{name}' was requested before build_singletons ran") from None
+
+        return provide_singleton
+
     def provide(self) -> dict[str, Provide]:
         provide_dict: dict[str, Provide] = {}
         for k, v in self._dep_registry.items():
-            if iscoroutinefunction(v.obj):
-                provide_dict[k] = Provide(v.obj, use_cache=v.use_cache)
+            if v.lifetime == "singleton":
+                # A plain lookup with no parameters, so Litestar has nothing to resolve for it per request
+                provide_dict[k] = Provide(self._provide_singleton(k), sync_to_thread=False)
+            elif iscoroutinefunction(v.obj):
+                provide_dict[k] = Provide(v.obj)
             else:
-                provide_dict[k] = Provide(v.obj, sync_to_thread=False, use_cache=v.use_cache)
+                provide_dict[k] = Provide(v.obj, sync_to_thread=False)
         return provide_dict
 
 
@@ -0,0 +1,34 @@
+import msgspec
+
+_COMMA = ord(",")
+
+
+class BufferedJsonEncoder:
+    """A single msgspec JSON encoder that writes into a single reusable buffer, for streaming JSON arrays in chunks
+
+    Each call copies its chunk out of the buffer, so the returned bytes stay valid across calls. Encoding never
+    awaits, so one instance can be shared by every request on the event loop, but not across threads. Whole
+    documents are better off with ``msgspec.json.Encoder.encode``, which has no copy out to make.
+    """
+
+    def __init__(self, initial_size: int = 64 * 1024) -> None:
+        self._encoder = msgspec.json.Encoder()
+        self._buffer = bytearray(initial_size)
+
+    def encode_lines(self, items: list) -> bytes:
+        # msgspec has no encode_into for newline-delimited JSON
+        return self._encoder.encode_lines(items)
+
+    def encode_array_items(self, items: list, first: bool) -> bytes:
+        """Encode non-empty ``items`` as the inside of a JSON array, with a leading comma unless they're the ``first``
+
+        Lets a JSON array be streamed in chunks, while each chunk is still encoded in a single call.
+        """
+        self._encoder.encode_into(items, self._buffer)
+        start = 1
+        if not first:
+            # Reuse the opening bracket's byte as the separator from the previous chunk
+            self._buffer[0] = _COMMA
+            start = 0
+        with memoryview(self._buffer) as view, view[start:-1] as items_view:
+            return bytes(items_view)
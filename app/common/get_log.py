@@ -1,13 +1,123 @@
 import logging
+from datetime import UTC, datetime
+from functools import cache
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+from typing import Any, Callable, Optional, Sequence
 
+import msgspec
 from litestar.logging import LoggingConfig
 from litestar.types import Logger
 
-log_config = LoggingConfig(
-    root={"level": logging.getLevelName(logging.INFO), "handlers": ["console"]},
-    formatters={"standard": {"format": "%(levelname)s:     %(message)s (%(filename)s:%(lineno)d)"}},
-)
+from app.common.settings import Settings
+
+TEXT_FORMAT = "%(levelname)s:     %(message)s (%(filename)s:%(lineno)d)"
+
+
+class LogQueueStats(msgspec.Struct):
+    queued: int
+    dropped: int
+    max_size: int
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to a background thread that writes them to ``handlers``, so logging never waits on their I/O
+
+    The queue holds up to ``max_size`` records. Past that new records are dropped and counted rather than blocking
+    the caller, which is usually the event loop.
+    """
+
+    def __init__(self, handlers: Sequence[logging.Handler], max_size: int = 10_000) -> None:
+        super().__init__(Queue(max_size))
+        self.max_size = max_size
+        self.dropped = 0
+        # dictConfig hands over a ConvertingList, indexing it resolves the cfg:// references to handlers
+        self.listener = QueueListener(
+            self.queue, *[handlers[i] for i in range(len(handlers))], respect_handler_level=True
+        )
+        self.listener.start()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is rendered here, in case its args change later. Formatting, tracebacks included, is
+        # left to the listener's thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        # Writes out whatever is still queued, dictConfig closes the old handlers when it's run again
+        self.listener.stop()
+        super().close()
+
+    def stats(self) -> LogQueueStats:
+        return LogQueueStats(self.queue.qsize(), self.dropped, self.max_size)  # type: ignore[attr-defined]
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log collectors"""
+
+    _encoder = msgspec.json.Encoder()
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, tz=UTC).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "location": f"{record.filename}:{record.lineno}",
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return self._encoder.encode(entry).decode()
+
+
+def create_log_config(settings: Settings) -> LoggingConfig:
+    handlers: dict[str, dict[str, Any]] = {
+        "console": {
+            "class": "logging.StreamHandler",
+            "level": "DEBUG",
+            "formatter": "json" if settings.log_format == "json" else "standard",
+        },
+    }
+    root_handler = "console"
+    if settings.log_handler == "queue":
+        # Litestar's own queue_listener is unbounded, this takes its place
+        handlers["queue_listener"] = {
+            "()": f"{__name__}.DroppingQueueHandler",
+            "handlers": ["cfg://handlers.console"],
+            "max_size": settings.log_queue_size,
+        }
+        root_handler = "queue_listener"
+    return LoggingConfig(
+        root={"level": logging.getLevelName(logging.INFO), "handlers": [root_handler]},
+        formatters={"standard": {"format": TEXT_FORMAT}, "json": {"()": f"{__name__}.JsonFormatter"}},
+        handlers=handlers,
+        loggers={"litestar": {"level": "INFO", "handlers": [root_handler], "propagate": False}},
+    )
+
+
+log_config = create_log_config(Settings.from_env())
+
+
+@cache
+def _configure() -> Callable[..., Logger]:
+    # Configuring again would tear down and restart every handler, including the queue's thread
+    return log_config.configure()
 
 
 def get_logger() -> Logger:
-    return log_config.configure()()
+    return _configure()()
+
+
+def get_log_queue_stats() -> Optional[LogQueueStats]:
+    """Stats of the root logger's queue, None when logs are written directly"""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            return handler.stats()
+    return None
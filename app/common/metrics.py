@@ -0,0 +1,224 @@
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Optional, Protocol
+
+import msgspec
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, ExceptionContext, ExecutionContext
+from sqlalchemy.engine.default import DefaultExecutionContext
+from sqlalchemy.pool import Pool
+
+# Seconds, roughly Prometheus' default buckets with a couple more at the fast end for SQLite
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Statements are labelled by their SQL, squashed onto one line and cut short so labels stay readable
+MAX_STATEMENT_LABEL_LENGTH = 120
+
+_WHITESPACE = re.compile(r"\s+")
+# Expanding IN parameters render one placeholder per value, fold them so each statement gets one label. Other
+# placeholder lists, e.g. an INSERT's VALUES, are left alone since they tell statements apart
+_PLACEHOLDER_LIST = re.compile(r"\bIN \(\?(?:, \?)*\)", re.IGNORECASE)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render_stats(prefix: str, stats: msgspec.Struct) -> list[str]:
+    """Every numeric field of a stats struct as a gauge named ``<prefix>_<field>``"""
+    lines: list[str] = []
+    for field in stats.__struct_fields__:
+        value = getattr(stats, field)
+        if isinstance(value, (int, float)):
+            lines.extend((f"# TYPE {prefix}_{field} gauge", f"{prefix}_{field} {value}"))
+    return lines
+
+
+def statement_label(statement: str) -> str:
+    statement = _PLACEHOLDER_LIST.sub("IN (?, ...)", _WHITESPACE.sub(" ", statement).strip())
+    if len(statement) > MAX_STATEMENT_LABEL_LENGTH:
+        return statement[: MAX_STATEMENT_LABEL_LENGTH - 3] + "..."
+    return statement
+
+
+class Metric(Protocol):
+    def render(self) -> list[str]:
+        ...
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, label_names: Labels = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        # Per label set, a count per bucket with the last one for +Inf
+        self._counts: dict[Labels, list[int]] = {}
+        self._sums: dict[Labels, float] = defaultdict(float)
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {self._sums[labels]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, label_names: Labels = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values: dict[Labels, float] = defaultdict(float)
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self._values[labels] += amount
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self._values[labels] -= amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Counter(Gauge):
+    type = "counter"
+
+
+class Metrics:
+    """In-process request and database metrics, rendered in the Prometheus text format
+
+    Every worker process keeps its own numbers, so with ``app start --prod`` each scrape only sees the
+    worker that happened to serve it.
+    """
+
+    def __init__(self) -> None:
+        self.request_duration = Histogram(
+            "http_request_duration_seconds",
+            "Time from the request reaching the app to the end of the response body",
+            ("method", "route", "status"),
+        )
+        self.requests_in_flight = Gauge("http_requests_in_flight", "Requests currently being served", ("route",))
+        self.db_statement_duration = Histogram(
+            "db_statement_duration_seconds", "Time spent executing a SQL statement", ("statement",)
+        )
+        self.db_compiled_cache = Counter(
+            "db_compiled_cache_total",
+            "Statement executions by whether SQLAlchemy's compiled cache had the statement (hit) or compiled it (miss)",
+            ("statement", "result"),
+        )
+        self.db_pool_checkout_duration = Histogram(
+            "db_pool_checkout_duration_seconds",
+            "Time spent getting a connection from the pool, including opening and configuring new ones",
+        )
+
+    def render(self) -> str:
+        lines: list[str] = []
+        metrics: tuple[Metric, ...] = (
+            self.request_duration,
+            self.requests_in_flight,
+            self.db_statement_duration,
+            self.db_compiled_cache,
+            self.db_pool_checkout_duration,
+        )
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def timed_pool_class(self, pool_class: type[Pool]) -> type[Pool]:
+        """``pool_class`` recording how long each checkout takes"""
+        histogram = self.db_pool_checkout_duration
+
+        class TimedPool(pool_class):  # type: ignore[valid-type, misc]
+            def _do_get(self) -> Any:
+                start = time.perf_counter()
+                try:
+                    return super()._do_get()
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+
+        return TimedPool
+
+    def instrument_engine(self, sync_engine: Any) -> None:
+        """Time every statement run on ``sync_engine``"""
+        histogram = self.db_statement_duration
+        compiled_cache = self.db_compiled_cache
+        labels: dict[str, str] = {}
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(
+            conn: Connection,
+            cursor: Any,
+            statement: str,
+            parameters: Any,
+            context: Optional[ExecutionContext],
+            executemany: bool,
+        ) -> None:
+            conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(
+            conn: Connection,
+            cursor: Any,
+            statement: str,
+            parameters: Any,
+            context: Optional[DefaultExecutionContext],
+            executemany: bool,
+        ) -> None:
+            elapsed = time.perf_counter() - conn.info["statement_start"].pop()
+            label = labels.get(statement)
+            if label is None:
+                label = labels[statement] = statement_label(statement)
+            histogram.observe(elapsed, (label,))
+            if context is not None:
+                compiled_cache.inc((label, context.cache_hit.name.lower()))
+
+        @event.listens_for(sync_engine, "handle_error")
+        def _error(context: ExceptionContext) -> None:
+            # after_cursor_execute doesn't run for failed statements, drop their start time
+            if context.connection is not None and context.connection.info.get("statement_start"):
+                context.connection.info["statement_start"].pop()
@@ -0,0 +1,88 @@
+import asyncio
+import cProfile
+import hmac
+import random
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from app.common.base_model import Base
+
+PROFILE_SUFFIX = ".prof"
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9]+")
+
+
+class ProfileInfo(Base):
+    name: str
+    size_bytes: int
+    created_at: datetime
+
+
+class RequestProfiler:
+    """Profiles single requests with cProfile and keeps the newest ``max_files`` pstats dumps in ``directory``
+
+    A request is profiled when it sends ``token`` in the profile header, or at random for ``sample_rate`` of
+    requests. Requests interleave on the event loop, so a profile would pick up whatever else ran in the
+    meantime - only one request is profiled at a time and others aren't profiled while it runs.
+    """
+
+    def __init__(self, directory: Path, max_files: int, sample_rate: float, token: str) -> None:
+        self.directory = directory
+        self.max_files = max_files
+        self.sample_rate = sample_rate
+        self.token = token
+        self.active = False
+
+    def should_profile(self, header_value: Optional[str]) -> bool:
+        if self.active:
+            return False
+        if self.has_token(header_value):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def has_token(self, header_value: Optional[str]) -> bool:
+        """Whether ``header_value`` is the configured token, never true when there's none"""
+        if not self.token or header_value is None:
+            return False
+        return hmac.compare_digest(header_value.encode(), self.token.encode())
+
+    def start(self, method: str, path: str) -> tuple[cProfile.Profile, str]:
+        """Start profiling a request, returns the profiler and the file name its profile will be stored under"""
+        self.active = True
+        # Starting with the time keeps names in the order they were written
+        name = f"{time.time_ns()}-{method}-{_UNSAFE_CHARS.sub('_', path).strip('_')}{PROFILE_SUFFIX}"
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile, name
+
+    async def finish(self, profile: cProfile.Profile, name: str) -> None:
+        """Stop ``profile``, write it out and drop the oldest profiles past ``max_files``"""
+        profile.disable()
+        self.active = False
+        await asyncio.to_thread(self._write, profile, name)
+
+    def _write(self, profile: cProfile.Profile, file_name: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(self.directory / file_name)
+        for old in self._files()[: -self.max_files]:
+            old.unlink(missing_ok=True)
+
+    def _files(self) -> list[Path]:
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("*" + PROFILE_SUFFIX))
+
+    def list_profiles(self) -> list[ProfileInfo]:
+        """Stored profiles, newest first"""
+        profiles = []
+        for path in reversed(self._files()):
+            stat = path.stat()
+            profiles.append(ProfileInfo(path.name, stat.st_size, datetime.fromtimestamp(stat.st_mtime)))
+        return profiles
+
+    def get_path(self, name: str) -> Optional[Path]:
+        """The file for a stored profile, or None if ``name`` isn't one of them"""
+        return next((path for path in self._files() if path.name == name), None)
@@ -0,0 +1,90 @@
+import os
+from typing import Annotated, Literal, Mapping, Optional
+
+import msgspec
+
+ENV_PREFIX = "APP_"
+
+# Checked by from_env, for settings where 0 would hang, fail every request or silently lift a bound, e.g. a batch
+# size, a refill rate or a queue size
+PositiveInt = Annotated[int, msgspec.Meta(gt=0)]
+PositiveFloat = Annotated[float, msgspec.Meta(gt=0)]
+
+
+class Settings(msgspec.Struct, frozen=True):
+    database_url: str = "sqlite+aiosqlite:///data.db"
+    # `app start --prod` migrates once before starting the workers and turns this off
+    migrate_on_startup: bool = True
+    # Named set of connection pragmas from app/common/db.py, the db_* values below override single pragmas
+    db_profile: Literal["default", "performance"] = "performance"
+    db_busy_timeout_ms: Optional[int] = None
+    db_cache_size: Optional[int] = None
+    db_mmap_size_bytes: Optional[int] = None
+    # Connections kept open to a database file, and how many prepared statements sqlite3 caches per connection
+    db_pool_size: PositiveInt = 5
+    db_cached_statements: int = 256
+    # How often to run PRAGMA optimize, 0 turns it off
+    db_optimize_interval_seconds: float = 3600.0
+    # Route writes through a single writer task that commits whatever is queued in one transaction
+    db_single_writer: bool = True
+    db_writer_max_batch_size: PositiveInt = 256
+    # Token -> AuthUser cache used by the auth middleware
+    token_cache_size: int = 1024
+    token_cache_ttl_seconds: float = 60.0
+    # "opaque" tokens are random strings looked up in the tokens table on every request, "signed" tokens
+    # are HMAC-signed and verified without touching the database
+    token_mode: Literal["opaque", "signed"] = "opaque"
+    token_secret: str = ""
+    token_revocation_refresh_seconds: float = 30.0
+    # Background sweep deactivating expired tokens and deleting inactive ones expired for longer than
+    # token_purge_after_seconds, an interval of 0 turns it off
+    token_sweep_interval_seconds: float = 300.0
+    token_sweep_batch_size: PositiveInt = 1000
+    token_purge_after_seconds: float = 7 * 24 * 3600.0
+    # argon2 hashing runs on a "thread" or "process" pool, 0 workers means one per cpu and 0 max concurrency
+    # means one call per worker
+    password_hasher_executor: Literal["thread", "process"] = "thread"
+    password_hasher_workers: int = 0
+    password_hasher_max_concurrency: int = 0
+    # Token buckets limiting login and register attempts per client IP and per email, "none" turns throttling off.
+    # Each bucket allows a burst of attempts, then refills at *_per_minute
+    login_throttle_backend: Literal["memory", "none"] = "memory"
+    login_throttle_ip_burst: PositiveInt = 20
+    login_throttle_ip_per_minute: PositiveFloat = 10.0
+    login_throttle_email_burst: PositiveInt = 5
+    login_throttle_email_per_minute: PositiveFloat = 2.0
+    login_throttle_max_keys: PositiveInt = 100_000
+    login_throttle_evict_interval_seconds: float = 60.0
+    # Encoded todo listings cached per user, "none" turns the cache off
+    response_cache_backend: Literal["memory", "none"] = "memory"
+    response_cache_max_bytes: int = 16 * 1024 * 1024
+    # `app build-static` builds static_source_dir into static_build_dir. The build is served when it exists,
+    # otherwise the source files are served as they are
+    static_source_dir: str = "app/static"
+    static_build_dir: str = "build/static"
+    # "queue" writes logs from a background thread through a queue of up to log_queue_size records, dropping records
+    # when it's full instead of blocking. "console" writes them directly. log_format is "text" or one "json" object
+    # per line
+    log_handler: Literal["queue", "console"] = "queue"
+    log_format: Literal["text", "json"] = "text"
+    log_queue_size: PositiveInt = 10_000
+    # Serve Prometheus metrics on /metrics, timing every request, statement and pool checkout
+    metrics_enabled: bool = False
+    # Profile single requests with cProfile: those sending profiling_token in the X-Profile header, plus a random
+    # profiling_sample_rate of all requests. The newest profiling_max_files pstats dumps are kept in profiling_dir.
+    profiling_enabled: bool = False
+    profiling_token: str = ""
+    profiling_sample_rate: float = 0.0
+    profiling_dir: str = "profiles"
+    profiling_max_files: PositiveInt = 100
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None) -> "Settings":
+        """Build settings from ``APP_<FIELD_NAME>`` environment variables, falling back to the defaults"""
+        environ = os.environ if environ is None else environ
+        values = {
+            field: environ[ENV_PREFIX + field.upper()]
+            for field in cls.__struct_fields__
+            if ENV_PREFIX + field.upper() in environ
+        }
+        return msgspec.convert(values, cls, strict=False)
@@ -0,0 +1,37 @@
+from typing import Any, ItemsView, Optional
+
+from sqlalchemy import BindParameter, TextClause, text
+
+
+class StatementRegistry:
+    """Every SQL statement the repos run, wrapped in ``text()`` once at import
+
+    Building ``text()`` per call re-parses the SQL for bind parameters every time, sharing one ``TextClause`` per
+    statement also means each one maps to a single entry in SQLAlchemy's compiled cache.
+
+    Statements added with ``explain_params`` are the ones ``app explain-queries`` checks for index use, run with those
+    representative parameters. Inserts and maintenance statements that have to read every row leave them out.
+    """
+
+    def __init__(self) -> None:
+        self._statements: dict[str, TextClause] = {}
+        self._explained: dict[str, tuple[TextClause, dict[str, Any]]] = {}
+
+    def add(
+        self, name: str, sql: str, *bindparams: BindParameter, explain_params: Optional[dict[str, Any]] = None
+    ) -> TextClause:
+        if name in self._statements:
+            raise Exception(f"Statement '{name}' is defined more than once")
+        statement = text(sql).bindparams(*bindparams) if bindparams else text(sql)
+        self._statements[name] = statement
+        if explain_params is not None:
+            explain = text("EXPLAIN QUERY PLAN " + sql)
+            self._explained[name] = (explain.bindparams(*bindparams) if bindparams else explain, explain_params)
+        return statement
+
+    def explained(self) -> ItemsView[str, tuple[TextClause, dict[str, Any]]]:
+        """``EXPLAIN QUERY PLAN`` of every statement added with ``explain_params``, with those params"""
+        return self._explained.items()
+
+
+statements = StatementRegistry()
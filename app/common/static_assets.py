@@ -0,0 +1,173 @@
+import gzip
+import hashlib
+import importlib.util
+import mimetypes
+import re
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import msgspec
+
+INDEX_FILE = "index.html"
+MANIFEST_FILE = "manifest.json"
+# Hashed names change with their content, so browsers can keep them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Everything else, i.e. index.html, is revalidated with its ETag on every load
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+# href="./style.css" or src="index.js", the captured name is looked up in the manifest
+_ASSET_REFERENCE = re.compile(r"""((?:href|src)=["'])(?:\./)?([^"'/?#]+)(["'])""")
+
+
+class StaticManifest(msgspec.Struct):
+    # Source name -> fingerprinted name
+    assets: dict[str, str]
+
+
+class StaticAsset(msgspec.Struct, frozen=True):
+    media_type: str
+    cache_control: str
+    # Content-Encoding ("identity" for the uncompressed file) -> (body, ETag)
+    variants: dict[str, tuple[bytes, str]]
+
+
+def _fingerprinted_name(name: str, content: bytes) -> str:
+    stem, dot, suffix = name.rpartition(".")
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f"{stem}.{digest}.{suffix}" if dot else f"{name}.{digest}"
+
+
+def _compress(content: bytes) -> dict[str, bytes]:
+    compressed = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+    if importlib.util.find_spec("brotli"):
+        import brotli
+
+        compressed["br"] = brotli.compress(content, quality=11)
+    # Tiny files can come out bigger compressed, those are only served as they are
+    return {encoding: body for encoding, body in compressed.items() if len(body) < len(content)}
+
+
+def _write_with_variants(path: Path, content: bytes) -> None:
+    path.write_bytes(content)
+    for encoding, body in _compress(content).items():
+        path.with_name(path.name + ENCODINGS[encoding]).write_bytes(body)
+
+
+def build_static_assets(source_dir: Path, out_dir: Path) -> StaticManifest:
+    """Copy ``source_dir`` into ``out_dir`` with fingerprinted names and precompressed variants
+
+    index.html keeps its name, its references to the other assets are rewritten to their fingerprinted names.
+    Anything already in ``out_dir`` is removed first.
+    """
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+
+    assets: dict[str, str] = {}
+    for path in sorted(source_dir.iterdir()):
+        if path.is_file() and path.name != INDEX_FILE:
+            content = path.read_bytes()
+            assets[path.name] = _fingerprinted_name(path.name, content)
+            _write_with_variants(out_dir / assets[path.name], content)
+
+    index = source_dir / INDEX_FILE
+    if index.exists():
+        html = _ASSET_REFERENCE.sub(
+            lambda m: f"{m[1]}{assets[m[2]]}{m[3]}" if m[2] in assets else m[0], index.read_text(encoding="utf-8")
+        )
+        _write_with_variants(out_dir / INDEX_FILE, html.encode())
+
+    manifest = StaticManifest(assets)
+    (out_dir / MANIFEST_FILE).write_bytes(msgspec.json.format(msgspec.json.encode(manifest)))
+    return manifest
+
+
+def pick_encoding(accept_encoding: Optional[str], available: set[str]) -> str:
+    """The preferred encoding in ``available`` that ``accept_encoding`` allows, otherwise identity"""
+    if not accept_encoding:
+        return "identity"
+    weights: dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        weight = 1.0
+        param_name, _, value = params.partition("=")
+        if param_name.strip() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip()] = weight
+    wildcard = weights.get("*", 0.0)
+    for encoding in ENCODINGS:
+        if encoding in available and weights.get(encoding, wildcard) > 0:
+            return encoding
+    return "identity"
+
+
+def _is_asset(path: Path) -> bool:
+    return path.is_file() and path.name != MANIFEST_FILE and path.suffix not in ENCODINGS.values()
+
+
+def _read_asset(path: Path, cache_control: str) -> StaticAsset:
+    variants: dict[str, tuple[bytes, str]] = {}
+    for encoding, suffix in {"identity": "", **ENCODINGS}.items():
+        variant = path.with_name(path.name + suffix)
+        if variant.exists():
+            body = variant.read_bytes()
+            # Strong ETags have to differ between encodings of the same file
+            variants[encoding] = (body, f'"{hashlib.sha256(body).hexdigest()[:16]}"')
+    return StaticAsset(mimetypes.guess_type(path.name)[0] or "application/octet-stream", cache_control, variants)
+
+
+class StaticAssets:
+    """Every file of a static directory held in memory with its precompressed variants, keyed by URL path
+
+    Serves a build from ``build_static_assets`` when ``directory`` has its manifest, with fingerprinted assets cached
+    forever. Otherwise serves the files as they are, revalidated on every load, and reads a file again whenever it
+    changes on disk so edits show up without a restart.
+    """
+
+    def __init__(self, directory: Path, assets: dict[str, StaticAsset], watch: bool) -> None:
+        self.directory = directory
+        self.watch = watch
+        self._assets = assets
+        # Name -> (mtime, size) of the file each asset was read from, only kept when watching
+        self._versions: dict[str, tuple[int, int]] = {}
+
+    @classmethod
+    def load(cls, directory: Path) -> "StaticAssets":
+        if not (directory / MANIFEST_FILE).exists():
+            return cls(directory, {}, watch=True)
+        manifest = msgspec.json.decode((directory / MANIFEST_FILE).read_bytes(), type=StaticManifest)
+        immutable = set(manifest.assets.values())
+        assets = {
+            path.name: _read_asset(
+                path, IMMUTABLE_CACHE_CONTROL if path.name in immutable else REVALIDATE_CACHE_CONTROL
+            )
+            for path in sorted(directory.iterdir())
+            if _is_asset(path)
+        }
+        return cls(directory, assets, watch=False)
+
+    def get(self, url_path: str) -> Optional[StaticAsset]:
+        name = url_path.strip("/") or INDEX_FILE
+        if not self.watch:
+            return self._assets.get(name)
+        # Only files directly in the directory are served, which also keeps out ".." and absolute paths
+        path = self.directory / name
+        if "/" in name or not _is_asset(path):
+            return None
+        try:
+            stat = path.stat()
+            version = (stat.st_mtime_ns, stat.st_size)
+            if self._versions.get(name) != version:
+                self._assets[name] = _read_asset(path, REVALIDATE_CACHE_CONTROL)
+                self._versions[name] = version
+        except FileNotFoundError:
+            # Editors often save by replacing the file, which can leave it missing for a moment
+            return None
+        return self._assets[name]
@@ -1,15 +1,103 @@
-from typing import Mapping, Type, TypeVar
+from datetime import date, datetime
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Mapping,
+    Optional,
+    Sequence,
+    Type,
+    TypeVar,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
 
 import msgspec
-from inflection import camelize
-from sqlalchemy import RowMapping
+from sqlalchemy import Result
 
 T = TypeVar("T", bound=msgspec.Struct)
 
+RowDecoder = Callable[[Sequence[Any]], T]
+
 
 def from_mapping(obj: Mapping, typ: Type[T]) -> T:
     return msgspec.convert(obj, msgspec.defstruct(typ.__name__, typ.__struct_fields__))  # type: ignore
 
 
-def camelize_row_mapping(row_mapping: RowMapping) -> dict:
-    return {camelize(k, False): v for k, v in row_mapping.items()}
+# SQLite hands back dates as ISO strings and booleans as integers, these turn them back into python values
+def _to_bool(value: Any) -> Optional[bool]:
+    return None if value is None else bool(value)
+
+
+def _to_date(value: Any) -> Optional[date]:
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _to_datetime(value: Any) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+_CONVERTERS: dict[Any, Callable[[Any], Any]] = {bool: _to_bool, date: _to_date, datetime: _to_datetime}
+
+_decoders: dict[tuple[tuple[str, ...], type], Callable] = {}
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _compile_row_decoder(columns: tuple[str, ...], typ: Type[T]) -> RowDecoder[T]:
+    hints = get_type_hints(typ)
+    namespace: dict[str, Any] = {"typ": typ}
+    args = []
+    for field in typ.__struct_fields__:
+        if field not in columns:
+            raise ValueError(f"Result is missing column '{field}' needed to build {typ.__name__}")
+        arg = f"row[{columns.index(field)}]"
+        converter = _CONVERTERS.get(_unwrap_optional(hints[field]))
+        if converter:
+            namespace[converter.__name__] = converter
+            arg = f"{converter.__name__}({arg})"
+        args.append(arg)
+    # Builds e.g. `lambda row: typ(row[0], row[1], _to_bool(row[5]))`, so decoding a row is a single call
+    # with the column lookups and conversions already worked out
+    return eval(f"lambda row: typ({', '.join(args)})", namespace)
+
+
+def get_row_decoder(columns: Iterable[str], typ: Type[T]) -> RowDecoder[T]:
+    """Get the decoder turning rows with ``columns`` into ``typ``, compiling it on first use"""
+    key = (tuple(columns), typ)
+    decoder = _decoders.get(key)
+    if decoder is None:
+        decoder = _decoders[key] = _compile_row_decoder(key[0], typ)
+    return decoder
+
+
+def decode_all(result: Result, typ: Type[T]) -> list[T]:
+    decoder = get_row_decoder(result.keys(), typ)
+    return [decoder(row) for row in result.fetchall()]
+
+
+def decode_first(result: Result, typ: Type[T]) -> Optional[T]:
+    decoder = get_row_decoder(result.keys(), typ)
+    row = result.first()
+    return decoder(row) if row else None
+
+
+def decode_one(result: Result, typ: Type[T]) -> T:
+    decoder = get_row_decoder(result.keys(), typ)
+    return decoder(result.one())
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match compares weakly, so W/ prefixes are ignored
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
@@ -1,35 +1,64 @@
+import time
 from datetime import datetime
+from typing import Optional
 
-from litestar import Request
 from litestar.exceptions import NotAuthorizedException
 from litestar.types import ASGIApp, Receive, Scope, Send
 
-from app.api.auth.repo import AuthRepo
+from app.api.auth.models import AuthUser
 from app.common.app_state import AppState
 
+# Key of the authenticated user in scope["state"], read back by provide_auth_user
+AUTH_USER_KEY = "auth_user"
+
+_AUTHORIZATION = b"authorization"
+
+
+def get_authorization_header(scope: Scope) -> Optional[str]:
+    # ASGI servers lower-case header names, so the raw list can be scanned without building a Request
+    for name, value in scope["headers"]:
+        if name == _AUTHORIZATION:
+            return value.decode("latin-1")
+    return None
+
+
+async def authenticate(app_state: AppState, auth_header: str) -> AuthUser:
+    # In a real app we would want to use less detailed error messages for security, but I'm being overly
+    # verbose here for testing
+    if app_state.token_signer:
+        # Signed tokens are verified purely in CPU, the revocation list covers deactivated ones
+        claims = app_state.token_signer.verify(auth_header)
+        if not claims or app_state.revocation_list.is_revoked(auth_header):
+            raise NotAuthorizedException("Invalid token")
+        if time.time() > claims.expires_at:
+            raise NotAuthorizedException("Token expired")
+        return AuthUser(claims.user_id, claims.email, claims.created_at)
+
+    user = app_state.token_cache.get(auth_header)
+    if user:
+        return user
+    found_token = await app_state.auth_repo.find_token_by_value(auth_header)
+    if not found_token:
+        raise NotAuthorizedException("Invalid token")
+    # Expired tokens are deactivated by the token sweeper, not on the request path
+    if datetime.now() > found_token.expires_at:
+        raise NotAuthorizedException("Token expired")
+    user = await app_state.auth_repo.get_auth_user_from_token(found_token)
+    app_state.token_cache.put(auth_header, found_token.token_id, user, found_token.expires_at)
+    return user
+
 
 def auth_middleware_factory(app: ASGIApp) -> ASGIApp:
     async def my_middleware(scope: Scope, receive: Receive, send: Send) -> None:
-        # Initialize auth flow - in a real app we would want to use less detailed error messages
-        # for security, but I'm being overly verbose here for testing
-        litestar_app = scope["app"]
-        app_state: AppState | None = litestar_app.state.get("app_state")
-        if not app_state:
-            raise Exception("Cannot find app_state in state")
-        auth_repo: AuthRepo = app_state.auth_repo
         if scope["type"] == "http":
-            request = Request(scope)
-            auth_header = request.headers.get("Authorization", None)
+            app_state: Optional[AppState] = scope["app"].state.get("app_state")
+            if not app_state:
+                raise Exception("Cannot find app_state in state")
+            auth_header = get_authorization_header(scope)
             if not auth_header:
                 raise NotAuthorizedException("Missing authorization header")
-            found_token = await auth_repo.find_token_by_value(auth_header)
-            if not found_token:
-                raise NotAuthorizedException("Invalid token")
-            if datetime.now() > found_token.expires_at:
-                await auth_repo.deactivate_token(found_token.token_id)
-                raise NotAuthorizedException("Token expired")
-            user = await auth_repo.get_auth_user_from_token(found_token)
-            litestar_app.state.app_state.auth_user = user
+            # Per request, so concurrent requests can't see each other's user
+            scope["state"][AUTH_USER_KEY] = await authenticate(app_state, auth_header)
         await app(scope, receive, send)
 
     return my_middleware
@@ -0,0 +1,53 @@
+import time
+from typing import Optional, cast
+
+from litestar import Litestar
+from litestar.types import ASGIApp, HTTPScope, Message, Receive, Scope, Send
+
+from app.common.app_state import AppState
+
+UNKNOWN_ROUTE = "unknown"
+
+
+def metrics_middleware_factory(app: ASGIApp) -> ASGIApp:
+    # Route handler -> the path template it's mounted at, so labels don't grow with every todo id
+    route_paths: dict[int, str] = {}
+
+    def get_route(litestar_app: Litestar, scope: Scope) -> str:
+        if not route_paths:
+            for route in litestar_app.routes:
+                for handler in getattr(route, "route_handlers", [getattr(route, "route_handler", None)]):
+                    route_paths[id(handler)] = route.path
+        return route_paths.get(id(scope.get("route_handler")), UNKNOWN_ROUTE)
+
+    async def my_middleware(scope: Scope, receive: Receive, send: Send) -> None:
+        litestar_app = scope["app"]
+        app_state: Optional[AppState] = litestar_app.state.get("app_state")
+        if scope["type"] != "http" or not app_state or not app_state.metrics:
+            await app(scope, receive, send)
+            return
+
+        metrics = app_state.metrics
+        method = cast(HTTPScope, scope)["method"]
+        route = get_route(litestar_app, scope)
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        metrics.requests_in_flight.inc((route,))
+        try:
+            await app(scope, receive, send_wrapper)
+        except Exception as ex:
+            # Exceptions are turned into responses further out, e.g. a 401 from the auth middleware
+            status = getattr(ex, "status_code", 500)
+            raise
+        finally:
+            metrics.requests_in_flight.dec((route,))
+            metrics.request_duration.observe(time.perf_counter() - start, (method, route, str(status)))
+
+    return my_middleware
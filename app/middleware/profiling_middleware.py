@@ -0,0 +1,43 @@
+from typing import Optional, cast
+
+from litestar.datastructures import Headers, MutableScopeHeaders
+from litestar.types import ASGIApp, HTTPScope, Message, Receive, Scope, Send
+
+from app.common.app_state import AppState
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+# Fetching profiles sends the same header, don't fill the ring buffer with profiles of that
+PROFILES_PATH = "/profiles"
+
+
+def profiling_middleware_factory(app: ASGIApp) -> ASGIApp:
+    async def my_middleware(scope: Scope, receive: Receive, send: Send) -> None:
+        app_state: Optional[AppState] = scope["app"].state.get("app_state")
+        if (
+            scope["type"] != "http"
+            or not app_state
+            or not app_state.profiler
+            or scope["path"].startswith(PROFILES_PATH)
+        ):
+            await app(scope, receive, send)
+            return
+
+        profiler = app_state.profiler
+        if not profiler.should_profile(Headers.from_scope(scope).get(PROFILE_HEADER)):
+            await app(scope, receive, send)
+            return
+
+        profile, name = profiler.start(cast(HTTPScope, scope)["method"], scope["path"])
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableScopeHeaders.from_message(message)[PROFILE_ID_HEADER] = name
+            await send(message)
+
+        try:
+            await app(scope, receive, send_wrapper)
+        finally:
+            await profiler.finish(profile, name)
+
+    return my_middleware
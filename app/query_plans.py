@@ -0,0 +1,35 @@
+import msgspec
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Imported for the statements they add to the registry
+from app.api.auth import repo as auth_repo  # noqa: F401
+from app.api.todos import repo as todo_repo  # noqa: F401
+from app.common.statements import statements
+
+
+class QueryPlan(msgspec.Struct):
+    name: str
+    details: list[str]
+
+    @property
+    def uses_index(self) -> bool:
+        """False if any step scans a whole table or has to sort into a temp b-tree
+
+        Full-text queries show up as a SCAN of the virtual table, but the FTS index serves them. A SELECT with no
+        FROM, e.g. one made of scalar subqueries, scans a single constant row.
+        """
+        return not any(
+            (detail.startswith("SCAN") and "VIRTUAL TABLE INDEX" not in detail and detail != "SCAN CONSTANT ROW")
+            or "TEMP B-TREE" in detail
+            for detail in self.details
+        )
+
+
+async def explain_hot_queries(engine: AsyncEngine) -> list[QueryPlan]:
+    """Plan every repo statement registered with ``explain_params``"""
+    plans: list[QueryPlan] = []
+    async with engine.connect() as conn:
+        for name, (explain, params) in statements.explained():
+            rows = await conn.execute(explain, params)
+            plans.append(QueryPlan(name, [detail for _, _, _, detail in rows.fetchall()]))
+    return plans
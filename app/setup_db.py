@@ -1,43 +1,276 @@
-# Normally we'd use a database migration tool for this, but I'm skipping that for now
+from typing import Optional
 
+import msgspec
 from sqlalchemy import text
-from sqlalchemy.ext.asyncio import AsyncEngine
-
-SQL = """
-CREATE TABLE IF NOT EXISTS users (
-    user_id INTEGER PRIMARY KEY,
-    email TEXT NOT NULL UNIQUE,
-    hashed_password TEXT NOT NULL,
-    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE TABLE IF NOT EXISTS tokens (
-    token_id INTEGER PRIMARY KEY,
-    value TEXT NOT NULL UNIQUE,
-    user_id INTEGER NOT NULL,
-    active INTEGER NOT NULL DEFAULT 1,
-    expires_at TEXT NOT NULL,
-    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    deactivated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users (user_id)
-);
-
-CREATE TABLE IF NOT EXISTS todos (
-    todo_id INTEGER PRIMARY KEY,
-    user_id INTEGER NOT NULL,
-    title TEXT NOT NULL,
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.common.get_log import get_logger
+
+_logger = get_logger()
+
+
+class Migration(msgspec.Struct, frozen=True):
+    version: int
+    description: str
+    # Run in order, one statement each so statements containing `;` (e.g. triggers) are fine
+    statements: tuple[str, ...]
+
+
+# Append only - once a migration has shipped, add a new one rather than changing it
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(
+        1,
+        "Create users, tokens and todos tables",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                email TEXT NOT NULL UNIQUE,
+                hashed_password TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS tokens (
+                token_id INTEGER PRIMARY KEY,
+                value TEXT NOT NULL UNIQUE,
+                user_id INTEGER NOT NULL,
+                active INTEGER NOT NULL DEFAULT 1,
+                expires_at TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                deactivated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS todos (
+                todo_id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                description TEXT NOT NULL,
+                due_date TEXT,
+                complete INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+            """,
+        ),
+    ),
+    Migration(
+        2,
+        "Add indexes for todo listings and token lookups",
+        (
+            # todo_id is the rowid, so both indexes also keep each user's todos ordered by todo_id
+            "CREATE INDEX IF NOT EXISTS ix_todos_user_id ON todos (user_id)",
+            "CREATE INDEX IF NOT EXISTS ix_todos_user_id_complete_todo_id ON todos (user_id, complete, todo_id)",
+            # Lookups by value already use the UNIQUE index, these cover finding expired and revoked tokens
+            "CREATE INDEX IF NOT EXISTS ix_tokens_active_expires_at ON tokens (expires_at) WHERE active = 1",
+            "CREATE INDEX IF NOT EXISTS ix_tokens_inactive_expires_at ON tokens (expires_at) WHERE active = 0",
+        ),
+    ),
+    Migration(
+        3,
+        "Track a per-user version of the todos, bumped by triggers on every write",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS todo_versions (
+                user_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS todos_after_insert_bump_version AFTER INSERT ON todos
+            BEGIN
+                INSERT INTO todo_versions (user_id, version) VALUES (NEW.user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS todos_after_update_bump_version AFTER UPDATE ON todos
+            BEGIN
+                INSERT INTO todo_versions (user_id, version) VALUES (NEW.user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS todos_after_delete_bump_version AFTER DELETE ON todos
+            BEGIN
+                INSERT INTO todo_versions (user_id, version) VALUES (OLD.user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            END
+            """,
+        ),
+    ),
+    Migration(
+        4,
+        "Add a full-text index over todo titles and descriptions",
+        (
+            # Contentless, the rows are read from todos. user_id is indexed too, so a search only walks the
+            # searching user's entries instead of everyone's
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(
+                title,
+                description,
+                user_id,
+                content = '',
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+            """,
+            # Title matches rank ten times higher than description matches, user_id doesn't count towards rank
+            "INSERT INTO todos_fts (todos_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 0.0)')",
+            """
+            CREATE TRIGGER IF NOT EXISTS todos_after_insert_index AFTER INSERT ON todos
+            BEGIN
+                INSERT INTO todos_fts (rowid, title, description, user_id)
+                VALUES (NEW.todo_id, NEW.title, NEW.description, NEW.user_id);
+            END
+            """,
+            # Contentless tables need the old values to remove a row's terms
+            """
+            CREATE TRIGGER IF NOT EXISTS todos_after_delete_index AFTER DELETE ON todos
+            BEGIN
+                INSERT INTO todos_fts (todos_fts, rowid, title, description, user_id)
+                VALUES ('delete', OLD.todo_id, OLD.title, OLD.description, OLD.user_id);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS todos_after_update_index AFTER UPDATE OF title, description, user_id ON todos
+            BEGIN
+                INSERT INTO todos_fts (todos_fts, rowid, title, description, user_id)
+                VALUES ('delete', OLD.todo_id, OLD.title, OLD.description, OLD.user_id);
+                INSERT INTO todos_fts (rowid, title, description, user_id)
+                VALUES (NEW.todo_id, NEW.title, NEW.description, NEW.user_id);
+            END
+            """,
+            """
+            INSERT INTO todos_fts (rowid, title, description, user_id)
+            SELECT todo_id, title, description, user_id FROM todos
+            """,
+        ),
+    ),
+    Migration(
+        5,
+        "Keep per-user todo counts up to date with triggers",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS todo_stats (
+                user_id INTEGER PRIMARY KEY,
+                total INTEGER NOT NULL,
+                complete INTEGER NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+            """,
+            # Open todos per due date. Whether a todo is overdue changes with the date rather than on a write, so
+            # the overdue count is summed from these at read time, walking one row per due date instead of per todo
+            """
+            CREATE TABLE IF NOT EXISTS todo_due_counts (
+                user_id INTEGER NOT NULL,
+                due_date TEXT NOT NULL,
+                open_count INTEGER NOT NULL,
+                PRIMARY KEY (user_id, due_date),
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            ) WITHOUT ROWID
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS todos_after_insert_count AFTER INSERT ON todos
+            BEGIN
+                INSERT INTO todo_stats (user_id, total, complete) VALUES (NEW.user_id, 1, NEW.complete)
+                ON CONFLICT (user_id) DO UPDATE SET total = total + 1, complete = complete + excluded.complete;
+                INSERT INTO todo_due_counts (user_id, due_date, open_count)
+                SELECT NEW.user_id, NEW.due_date, 1 WHERE NEW.due_date IS NOT NULL AND NEW.complete = 0
+                ON CONFLICT (user_id, due_date) DO UPDATE SET open_count = open_count + 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS todos_after_delete_count AFTER DELETE ON todos
+            BEGIN
+                UPDATE todo_stats SET total = total - 1, complete = complete - OLD.complete
+                WHERE user_id = OLD.user_id;
+                UPDATE todo_due_counts SET open_count = open_count - 1
+                WHERE user_id = OLD.user_id AND due_date = OLD.due_date AND OLD.complete = 0;
+                DELETE FROM todo_due_counts WHERE user_id = OLD.user_id AND due_date = OLD.due_date AND open_count = 0;
+            END
+            """,
+            # The delete trigger's steps for the old row, then the insert trigger's steps for the new one
+            """
+            CREATE TRIGGER IF NOT EXISTS todos_after_update_count AFTER UPDATE OF user_id, due_date, complete ON todos
+            BEGIN
+                UPDATE todo_stats SET total = total - 1, complete = complete - OLD.complete
+                WHERE user_id = OLD.user_id;
+                UPDATE todo_due_counts SET open_count = open_count - 1
+                WHERE user_id = OLD.user_id AND due_date = OLD.due_date AND OLD.complete = 0;
+                DELETE FROM todo_due_counts WHERE user_id = OLD.user_id AND due_date = OLD.due_date AND open_count = 0;
+                INSERT INTO todo_stats (user_id, total, complete) VALUES (NEW.user_id, 1, NEW.complete)
+                ON CONFLICT (user_id) DO UPDATE SET total = total + 1, complete = complete + excluded.complete;
+                INSERT INTO todo_due_counts (user_id, due_date, open_count)
+                SELECT NEW.user_id, NEW.due_date, 1 WHERE NEW.due_date IS NOT NULL AND NEW.complete = 0
+                ON CONFLICT (user_id, due_date) DO UPDATE SET open_count = open_count + 1;
+            END
+            """,
+            """
+            INSERT INTO todo_stats (user_id, total, complete)
+            SELECT user_id, COUNT(*), SUM(complete) FROM todos GROUP BY user_id
+            """,
+            """
+            INSERT INTO todo_due_counts (user_id, due_date, open_count)
+            SELECT user_id, due_date, COUNT(*) FROM todos
+            WHERE due_date IS NOT NULL AND complete = 0
+            GROUP BY user_id, due_date
+            """,
+        ),
+    ),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
     description TEXT NOT NULL,
-    due_date TEXT,
-    complete INTEGER NOT NULL DEFAULT 0,
-    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users (user_id)
-);
+    applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
 """
 
 
-async def setup_db(engine: AsyncEngine) -> None:
-    statements = SQL.split(";")
+async def _current_version(conn: AsyncConnection) -> int:
+    await conn.execute(text(SCHEMA_VERSION_SQL))
+    return (await conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version"))).scalar_one()
+
+
+async def get_schema_version(engine: AsyncEngine) -> int:
     async with engine.connect() as conn:
-        for statement in statements:
-            await conn.execute(text(statement))
+        version = await _current_version(conn)
         await conn.commit()
+        return version
+
+
+async def migrate(engine: AsyncEngine, target_version: Optional[int] = None) -> list[Migration]:
+    """Apply every migration newer than the database's schema version, up to ``target_version``"""
+    target_version = LATEST_VERSION if target_version is None else target_version
+    applied: list[Migration] = []
+    async with engine.connect() as conn:
+        for migration in MIGRATIONS:
+            if migration.version > target_version:
+                break
+            async with conn.begin():
+                # pysqlite only opens a transaction before DML, so without this the DDL would run in autocommit mode
+                # and a failing migration would leave its earlier statements behind. IMMEDIATE takes the write lock
+                # up front, so the version check below also keeps out another process migrating at the same time
+                await conn.exec_driver_sql("BEGIN IMMEDIATE")
+                if migration.version <= await _current_version(conn):
+                    continue
+                _logger.info(f"Applying migration {migration.version}: {migration.description}")
+                for statement in migration.statements:
+                    await conn.execute(text(statement))
+                await conn.execute(
+                    text("INSERT INTO schema_version (version, description) VALUES (:version, :description)"),
+                    {"version": migration.version, "description": migration.description},
+                )
+            applied.append(migration)
+    return applied
+
+
+async def setup_db(engine: AsyncEngine) -> None:
+    await migrate(engine)
@@ -0,0 +1,73 @@
+"""Microseconds per call for the auth middleware alone, with the token already in the token cache
+
+Also compares reading the Authorization header through a ``litestar.Request`` (what the middleware used to do) with
+scanning the raw ASGI headers. Run with ``python -m benchmarks.auth_middleware``
+"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any
+
+import click
+from litestar import Request
+from litestar.datastructures import State
+
+from app.api.auth.models import AuthUser
+from app.api.auth.token_cache import TokenCache
+from app.middleware.auth_middleware import auth_middleware_factory, get_authorization_header
+from benchmarks.timing import async_best_of, best_of
+
+TOKEN = "x" * 32
+
+# Headers a browser typically sends, with Authorization last as the worst case for the scan
+HEADERS = [
+    (b"host", b"localhost:8000"),
+    (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0"),
+    (b"accept", b"application/json"),
+    (b"accept-language", b"en-US,en;q=0.5"),
+    (b"accept-encoding", b"gzip, deflate, br"),
+    (b"referer", b"http://localhost:8000/"),
+    (b"connection", b"keep-alive"),
+    (b"authorization", TOKEN.encode()),
+]
+
+
+def _make_scope() -> dict[str, Any]:
+    token_cache = TokenCache(1024, 3600)
+    token_cache.put(TOKEN, 1, AuthUser(1, "user@example.com", datetime.now()), datetime.now() + timedelta(hours=1))
+    # Only the attributes the middleware touches
+    app_state = SimpleNamespace(token_signer=None, token_cache=token_cache, auth_repo=None)
+    app = SimpleNamespace(state=State({"app_state": app_state}))
+    return {"type": "http", "app": app, "headers": HEADERS, "state": {}, "path": "/api/todos", "method": "GET"}
+
+
+async def _noop_app(scope: Any, receive: Any, send: Any) -> None:
+    ...
+
+
+async def _noop_receive() -> Any:
+    ...
+
+
+async def _noop_send(message: Any) -> None:
+    ...
+
+
+@click.command()
+@click.option("--calls", type=int, default=100_000, show_default=True)
+def main(calls: int) -> None:
+    scope: Any = _make_scope()
+    middleware = auth_middleware_factory(_noop_app)
+
+    request_lookup = best_of(lambda: Request(scope).headers.get("Authorization"), calls)
+    raw_lookup = best_of(lambda: get_authorization_header(scope), calls)
+    full = asyncio.run(async_best_of(lambda: middleware(scope, _noop_receive, _noop_send), calls))
+    assert scope["state"]["auth_user"].user_id == 1
+
+    click.echo(f"Request(scope).headers.get: {request_lookup:>8.3f} us/call")
+    click.echo(f"raw header scan:            {raw_lookup:>8.3f} us/call ({request_lookup / raw_lookup:.1f}x)")
+    click.echo(f"whole middleware, cached:   {full:>8.3f} us/call")
+
+
+if __name__ == "__main__":
+    main()
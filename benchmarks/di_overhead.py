@@ -0,0 +1,93 @@
+"""Microseconds per request for resolving ``AuthService`` and its dependencies, per dependency lifetime
+
+Each app has a single handler taking an ``AuthService`` and is called directly through ASGI, so the numbers are
+routing and dependency resolution only. Run with ``python -m benchmarks.di_overhead``
+"""
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Optional
+
+import click
+from argon2 import PasswordHasher
+from litestar import Litestar, get
+
+from app import provide_auth_repo, provide_password_hasher, provide_token_signer
+from app.api.auth.hasher import AsyncPasswordHasher
+from app.api.auth.repo import AuthRepo
+from app.api.auth.service import AuthService
+from app.common.deps import DependencyRegistry, Lifetime
+from benchmarks.timing import async_best_of
+
+
+@get("/")
+async def handler(auth_service: AuthService) -> None:
+    ...
+
+
+@get("/")
+async def handler_without_deps() -> None:
+    ...
+
+
+async def _make_app(lifetime: Optional[Lifetime]) -> Litestar:
+    registry = DependencyRegistry()
+    if lifetime:
+        registry(provide_auth_repo, rename="auth_repo", lifetime=lifetime)
+        registry(provide_password_hasher, rename="password_hasher", lifetime=lifetime)
+        registry(provide_token_signer, rename="token_signer", lifetime=lifetime)
+        registry(AuthService, lifetime=lifetime)
+    app = Litestar(route_handlers=[handler if lifetime else handler_without_deps], plugins=[registry])
+    # Only the attributes the providers touch
+    app.state.app_state = SimpleNamespace(
+        auth_repo=AuthRepo(None, None, None, None),  # type: ignore
+        password_hasher=AsyncPasswordHasher.create(PasswordHasher(), "thread", 1, 1),
+        token_signer=None,
+    )
+    await registry.build_singletons(app.state)
+    return app
+
+
+async def _best_of(app: Litestar, calls: int) -> float:
+    async def receive() -> Any:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Any) -> None:
+        ...
+
+    def make_scope() -> Any:
+        return {
+            "type": "http",
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/",
+            "raw_path": b"/",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [],
+            "server": ("localhost", 8000),
+            "client": ("127.0.0.1", 50000),
+            "state": {},
+        }
+
+    return await async_best_of(lambda: app(make_scope(), receive, send), calls)
+
+
+async def _run(calls: int) -> dict[str, float]:
+    results = {}
+    for label, lifetime in (("no dependencies", None), ("request", "request"), ("singleton", "singleton")):
+        results[label] = await _best_of(await _make_app(lifetime), calls)  # type: ignore
+    return results
+
+
+@click.command()
+@click.option("--calls", type=int, default=20_000, show_default=True)
+def main(calls: int) -> None:
+    results = asyncio.run(_run(calls))
+    baseline = results["no dependencies"]
+    for label, micros in results.items():
+        click.echo(f"{label + ':':<17} {micros:>8.3f} us/request ({micros - baseline:+.3f} us for DI)")
+
+
+if __name__ == "__main__":
+    main()
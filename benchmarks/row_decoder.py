@@ -0,0 +1,72 @@
+"""Rows/sec decoding todo rows the old way (camelize each row + msgspec.convert) vs the precompiled row decoder
+
+Run with ``python -m benchmarks.row_decoder``
+"""
+import sqlite3
+import time
+from typing import Callable
+
+import click
+import msgspec
+from inflection import camelize
+
+from app.api.todos.models import Todo
+from app.common.utils import get_row_decoder
+
+
+def _load_rows(count: int) -> tuple[list[str], list[tuple]]:
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        """
+        CREATE TABLE todos (
+            todo_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            due_date TEXT,
+            complete INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.executemany(
+        "INSERT INTO todos (user_id, title, description, due_date, complete) VALUES (1, ?, ?, ?, ?)",
+        [(f"Todo {i}", f"Description {i}", "2024-01-01" if i % 2 else None, i % 3 == 0) for i in range(count)],
+    )
+    cursor = conn.execute("SELECT * FROM todos")
+    return [c[0] for c in cursor.description], cursor.fetchall()
+
+
+def _camelize_and_convert(columns: list[str], rows: list[tuple]) -> list[Todo]:
+    return [msgspec.convert({camelize(k, False): v for k, v in zip(columns, row)}, Todo, strict=False) for row in rows]
+
+
+def _precompiled(columns: list[str], rows: list[tuple]) -> list[Todo]:
+    decoder = get_row_decoder(columns, Todo)
+    return [decoder(row) for row in rows]
+
+
+def _rows_per_second(
+    fn: Callable[[list[str], list[tuple]], list[Todo]], columns: list[str], rows: list[tuple]
+) -> float:
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        fn(columns, rows)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+@click.command()
+@click.option("--rows", type=int, default=10_000, show_default=True)
+def main(rows: int) -> None:
+    columns, data = _load_rows(rows)
+    assert _camelize_and_convert(columns, data) == _precompiled(columns, data)
+    before = _rows_per_second(_camelize_and_convert, columns, data)
+    after = _rows_per_second(_precompiled, columns, data)
+    click.echo(f"camelize_row_mapping + msgspec.convert: {before:>12,.0f} rows/sec")
+    click.echo(f"precompiled row decoder:                {after:>12,.0f} rows/sec ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import time
+from typing import Awaitable, Callable
+
+ROUNDS = 5
+
+
+def best_of(fn: Callable[[], object], calls: int) -> float:
+    """Microseconds per call of ``fn``, from the fastest of ``ROUNDS`` rounds of ``calls`` calls"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / calls * 1_000_000
+
+
+async def async_best_of(fn: Callable[[], Awaitable[object]], calls: int) -> float:
+    """Like ``best_of``, awaiting each call"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(calls):
+            await fn()
+        best = min(best, time.perf_counter() - start)
+    return best / calls * 1_000_000
@@ -0,0 +1,70 @@
+"""Microseconds to encode 1k todos as a JSON array, through Litestar's serialization vs reused msgspec encoders
+
+Also compares the chunked JSON array stream encoding each todo separately and joining them (what it used to do) with
+encoding each chunk in a single call into a reusable buffer. Run with ``python -m benchmarks.todo_encoding``
+"""
+from datetime import date, datetime
+
+import click
+import msgspec
+from litestar.serialization import encode_json
+
+from app.api.todos.models import Todo
+from app.common.encoding import BufferedJsonEncoder
+from benchmarks.timing import best_of
+
+
+def _make_todos(count: int) -> list[Todo]:
+    return [
+        Todo(
+            i,
+            1,
+            f"Todo {i}",
+            f"Seeded todo {i} for user 1",
+            date(2024, 1, 1) if i % 2 else None,
+            i % 3 == 0,
+            datetime(2024, 1, 1, 12, 0, 0),
+        )
+        for i in range(count)
+    ]
+
+
+@click.command()
+@click.option("--calls", type=int, default=2_000, show_default=True)
+@click.option("--chunk-size", type=int, default=100, show_default=True)
+def main(calls: int, chunk_size: int) -> None:
+    todos = _make_todos(1000)
+    chunks = [todos[i : i + chunk_size] for i in range(0, len(todos), chunk_size)]
+    encoder = msgspec.json.Encoder()
+    buffered = BufferedJsonEncoder()
+    buffer = bytearray(64 * 1024)
+    assert b"[" + b"".join(buffered.encode_array_items(c, i == 0) for i, c in enumerate(chunks)) + b"]" == (
+        encode_json(todos)
+    )
+
+    def encode_into_and_copy() -> bytes:
+        encoder.encode_into(todos, buffer)
+        return bytes(buffer)
+
+    def joined() -> None:
+        for chunk in chunks:
+            b",".join(encoder.encode(todo) for todo in chunk)
+
+    def buffered_chunks() -> None:
+        for i, chunk in enumerate(chunks):
+            buffered.encode_array_items(chunk, i == 0)
+
+    results = {
+        "litestar encode_json": best_of(lambda: encode_json(todos), calls),
+        "msgspec.json.encode": best_of(lambda: msgspec.json.encode(todos), calls),
+        "reused Encoder": best_of(lambda: encoder.encode(todos), calls),
+        "encode_into + copy": best_of(encode_into_and_copy, calls),
+        "stream, joined": best_of(joined, calls),
+        "stream, buffered": best_of(buffered_chunks, calls),
+    }
+    for label, micros in results.items():
+        click.echo(f"{label + ':':<22} {micros:>8.1f} us per 1k todos")
+
+
+if __name__ == "__main__":
+    main()